@@ -1,260 +1,416 @@
-### FINDING TRADES AND PLACING ORDERS
-
-import os
-import logging
-from datetime import datetime
-from dotenv import load_dotenv
-from typing import Dict, List, Optional, Tuple
-import requests
-
-from src.utils.wallet_balance_checker import DeltaWallet
-from src.trading.delta_signals import get_delta_signals, DeltaSignals
-from src.trading.check_min_order import DeltaMarginChecker
-from src.trading.place_order import DeltaExchange
-from src.trading.open_positions_fetcher import OpenPositionsFetcher
-
-# Setup logging
-def setup_logger():
-    logger = logging.getLogger('DeltaTrading')
-    logger.setLevel(logging.INFO)
-    
-    # Create logs directory if it doesn't exist
-    log_dir = 'logs'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    # Create formatters and handlers
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
-    # File handler with path to logs directory
-    file_handler = logging.FileHandler(
-        os.path.join(log_dir, f'delta_trading_{datetime.now().strftime("%Y%m%d")}.log')
-    )
-    console_handler = logging.StreamHandler()
-    
-    # Set formatters
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-    
-    # Add handlers
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger
-
-class DeltaTradingSystem:
-    def __init__(self):
-        load_dotenv()
-        self.api_key = os.getenv('API_KEY')
-        self.api_secret = os.getenv('API_SECRET')
-        self.logger = setup_logger()
-        
-        # Initialize components
-        self.wallet = DeltaWallet()
-        self.margin_checker = DeltaMarginChecker(self.api_key, self.api_secret)
-        self.exchange = DeltaExchange()
-        self.signals = DeltaSignals(self.api_key, self.api_secret)
-        self.positions_fetcher = OpenPositionsFetcher(self.api_key, self.api_secret)
-        
-        # Initialize product mapping
-        self.product_mapping = {}
-        
-    def get_product_mapping(self) -> Dict[str, int]:
-        """Get mapping of symbol to product ID from Delta Exchange."""
-        try:
-            self.logger.info("Fetching product mapping from Delta Exchange...")
-            
-            # Use the existing method from DeltaSignals
-            products = self.signals._get_all_usd_products()
-            
-            if not products:
-                self.logger.error("Failed to fetch product mapping")
-                return {}
-                
-            # Create mapping from the products list
-            mapping = {product['symbol']: product['id'] for product in products}
-            self.logger.info(f"Successfully fetched product mapping for {len(mapping)} symbols")
-            return mapping
-            
-        except Exception as e:
-            self.logger.error(f"Error getting product mapping: {str(e)}")
-            return {}
-        
-    def get_available_balance(self) -> float:
-        """Get available balance and calculate remaining trading capacity."""
-        try:
-            total_balance = self.wallet.get_usd_balance()
-            available_balance = self.wallet.get_usd_available_balance()
-            max_trading_balance = total_balance * 0.5  # 50% of total balance
-            used_balance = total_balance - available_balance
-            remaining_trading_balance = max_trading_balance - used_balance
-            
-            self.logger.info(f"Total Balance: ${total_balance:,.2f}")
-            self.logger.info(f"Max Trading Balance (50%): ${max_trading_balance:,.2f}")
-            self.logger.info(f"Used Balance: ${used_balance:,.2f}")
-            self.logger.info(f"Remaining Trading Balance: ${remaining_trading_balance:,.2f}")
-            
-            return max(0.0, remaining_trading_balance)  # Don't return negative balance
-        except Exception as e:
-            self.logger.error(f"Error getting balance: {str(e)}")
-            return 0.0
-
-    def get_trading_opportunities(self, trading_balance: float) -> List[Dict]:
-        """Get trading opportunities based on signals and margin requirements."""
-        try:
-            # Get active signals
-            self.logger.info("Fetching trading signals...")
-            signals = get_delta_signals(self.api_key, self.api_secret)
-            if not signals:
-                self.logger.info("No active signals found")
-                return []
-
-            # Get margin requirements
-            self.logger.info("Fetching margin requirements...")
-            margin_requirements = self.margin_checker.get_margin_requirements()
-            if not margin_requirements:
-                self.logger.error("Failed to get margin requirements")
-                return []
-
-            # Create margin lookup dictionary
-            margin_lookup = {list(item.keys())[0]: float(list(item.values())[0].replace('$', '')) 
-                           for item in margin_requirements}
-
-            # Filter opportunities based on available balance
-            opportunities = []
-            for signal in signals:
-                symbol = list(signal.keys())[0]
-                direction = signal[symbol]
-                margin_required = margin_lookup.get(symbol, float('inf'))
-                
-                if margin_required <= trading_balance:
-                    opportunities.append({
-                        'symbol': symbol,
-                        'direction': direction,
-                        'margin_required': margin_required
-                    })
-
-            return opportunities
-
-        except Exception as e:
-            self.logger.error(f"Error getting trading opportunities: {str(e)}")
-            return []
-
-    def get_existing_positions(self) -> Dict[str, str]:
-        """Get currently open positions and their directions."""
-        try:
-            self.logger.info("Fetching existing positions...")
-            positions = self.positions_fetcher.get_open_positions()
-            
-            position_map = {}
-            for position in positions:
-                symbol = position['product_symbol']
-                size = float(position['position'].get('size', 0))
-                if size != 0:  # Only consider non-zero positions
-                    direction = 'LONG' if size > 0 else 'SHORT'
-                    position_key = f"{symbol}_{direction}"  # Include direction in key
-                    position_map[position_key] = direction
-                    self.logger.info(f"Found existing position: {symbol} {direction}")
-                    
-            self.logger.info(f"Found {len(position_map)} existing positions")
-            return position_map
-            
-        except Exception as e:
-            self.logger.error(f"Error fetching existing positions: {str(e)}")
-            return {}
-
-    def execute_trades(self, opportunities: List[Dict]):
-        """Execute trades for the identified opportunities, avoiding duplicate positions."""
-        # Get product mapping if not already available
-        if not self.product_mapping:
-            self.product_mapping = self.get_product_mapping()
-            if not self.product_mapping:
-                self.logger.error("Failed to get product mapping. Cannot execute trades.")
-                return
-
-        # Get existing positions
-        existing_positions = self.get_existing_positions()
-        
-        # Filter out opportunities where we already have same direction positions
-        filtered_opportunities = []
-        for opp in opportunities:
-            symbol = opp['symbol']
-            direction = opp['direction']
-            position_key = f"{symbol}_{direction}"
-            
-            if position_key in existing_positions:
-                self.logger.info(f"Skipping {symbol} {direction} - Already have this direction position")
-                continue
-            filtered_opportunities.append(opp)
-            
-        if not filtered_opportunities:
-            self.logger.info("No new opportunities to trade after filtering existing positions")
-            return
-            
-        self.logger.info(f"Found {len(filtered_opportunities)} new opportunities after filtering existing positions")
-            
-        for opp in filtered_opportunities:
-            try:
-                symbol = opp['symbol']
-                self.logger.info(f"Placing {opp['direction']} order for {symbol}")
-                
-                # Get product ID from mapping
-                product_id = self.product_mapping.get(symbol)
-                if not product_id:
-                    self.logger.error(f"Could not find product ID for symbol {symbol}")
-                    continue
-                
-                # Determine size based on symbol
-                if symbol == 'AAVEUSD':
-                    size = 2
-                elif symbol == 'SOLUSD':
-                    size = 4
-                else:
-                    size = 6
-                
-                self.logger.info(f"Setting order size to {size} for {symbol}")
-                
-                # Place the order
-                response = self.exchange.place_order(
-                    product_id=product_id,
-                    size=size,  # Dynamic size based on symbol
-                    order_type='market_order',
-                    side='buy' if opp['direction'] == 'LONG' else 'sell'
-                )
-                
-                if response.get('success'):
-                    self.logger.info(f"Successfully placed order for {symbol} with size {size}")
-                else:
-                    self.logger.error(f"Failed to place order for {symbol}: {response}")
-                    
-            except Exception as e:
-                self.logger.error(f"Error executing trade for {opp['symbol']}: {str(e)}")
-
-    def run(self):
-        """Main trading system execution."""
-        try:
-            self.logger.info("Starting Delta Trading System")
-            
-            # Get available balance
-            trading_balance = self.get_available_balance()
-            if trading_balance <= 0:
-                self.logger.error("Insufficient balance for trading")
-                return
-
-            # Get trading opportunities
-            opportunities = self.get_trading_opportunities(trading_balance)
-            if not opportunities:
-                self.logger.info("No suitable trading opportunities found")
-                return
-
-            # Execute trades
-            self.execute_trades(opportunities)
-            
-            self.logger.info("Trading system execution completed")
-
-        except Exception as e:
-            self.logger.error(f"Error in main execution: {str(e)}")
-
-if __name__ == "__main__":
-    trading_system = DeltaTradingSystem()
-    trading_system.run()
+### FINDING TRADES AND PLACING ORDERS
+
+import os
+import argparse
+import json
+import logging
+import time
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from dotenv import load_dotenv
+from typing import Dict, List, Optional, Set, Tuple
+import requests
+
+from src.utils.wallet_balance_checker import DeltaWallet
+from src.trading.delta_signals import DeltaSignals
+from src.trading.check_min_order import DeltaMarginChecker
+from src.trading.place_order import DeltaExchange
+from src.trading.open_positions_fetcher import OpenPositionsFetcher
+from src.utils.file_cache import FileCache
+
+# Environment is read once at import instead of on every DeltaTradingSystem()
+load_dotenv()
+
+API_KEY = os.getenv('API_KEY')
+API_SECRET = os.getenv('API_SECRET')
+
+# Product IDs change rarely (new listings), so the symbol mapping is cached on disk
+PRODUCT_MAPPING_TTL = 24 * 60 * 60
+
+# Disk cache next to this script, independent of the directory cron starts in
+CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cache')
+
+# Setup logging
+def setup_logger():
+    logger = logging.getLogger('DeltaTrading')
+    
+    # Handlers are attached once per process; repeated calls reuse them
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.INFO)
+    
+    # Create logs directory if it doesn't exist
+    log_dir = 'logs'
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    
+    # Create formatters and handlers
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    
+    # File handler with path to logs directory, capped at 5 x 10 MB
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, f'delta_trading_{datetime.now().strftime("%Y%m%d")}.log'),
+        maxBytes=10_000_000,
+        backupCount=5
+    )
+    console_handler = logging.StreamHandler()
+    
+    # Set formatters
+    file_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
+    
+    # Add handlers
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    
+    return logger
+
+class DeltaTradingSystem:
+    # Order size (lots) per symbol; anything not listed uses DEFAULT_SIZE
+    SIZE_OVERRIDES: Dict[str, int] = {'AAVEUSD': 2, 'SOLUSD': 4}
+    DEFAULT_SIZE = 6
+    
+    def __init__(self, refresh_mapping: bool = False):
+        self.api_key = API_KEY
+        self.api_secret = API_SECRET
+        self.logger = setup_logger()
+        
+        # Optional JSON overrides for order sizes, e.g. SIZE_TABLE_JSON='{"BTCUSD": 1}'
+        self.size_overrides = dict(self.SIZE_OVERRIDES)
+        size_table = os.getenv('SIZE_TABLE_JSON')
+        if size_table:
+            try:
+                self.size_overrides.update(json.loads(size_table))
+            except (ValueError, TypeError) as e:
+                self.logger.error("Ignoring invalid SIZE_TABLE_JSON: %s", e)
+        
+        # Initialize components
+        self.wallet = DeltaWallet()
+        self.margin_checker = DeltaMarginChecker(self.api_key, self.api_secret, cache_dir=CACHE_DIR)
+        self.exchange = DeltaExchange()
+        self.signals = DeltaSignals(self.api_key, self.api_secret, cache_dir=CACHE_DIR)
+        self.positions_fetcher = OpenPositionsFetcher(self.api_key, self.api_secret, cache_dir=CACHE_DIR)
+        
+        # Initialize product mapping
+        self.product_mapping = {}
+        self.cache = FileCache(CACHE_DIR)
+        self.refresh_mapping = refresh_mapping
+        
+    def get_product_mapping(self, refresh: bool = False) -> Dict[str, int]:
+        """Get mapping of symbol to product ID, from the disk cache when it is fresh enough.
+
+        With `refresh`, both the cached mapping and the cached product list are bypassed.
+        """
+        try:
+            if not refresh:
+                mapping = self.cache.get('product_mapping', PRODUCT_MAPPING_TTL)
+                if mapping:
+                    self.logger.info("Loaded product mapping for %s symbols from cache", len(mapping))
+                    return mapping
+            
+            self.logger.info("Fetching product mapping from Delta Exchange...")
+            
+            # Use the existing method from DeltaSignals
+            products = self.signals._get_all_usd_products(refresh=refresh)
+            
+            if not products:
+                self.logger.error("Failed to fetch product mapping")
+                return {}
+                
+            # Create mapping from the products list
+            mapping = {product['symbol']: product['id'] for product in products}
+            self.logger.info("Successfully fetched product mapping for %s symbols", len(mapping))
+            
+            try:
+                self.cache.set('product_mapping', mapping)
+            except OSError as e:
+                self.logger.warning("Could not cache product mapping: %s", e)
+            return mapping
+            
+        except Exception as e:
+            self.logger.error("Error getting product mapping: %s", e)
+            return {}
+        
+    def get_available_balance(self) -> float:
+        """Get available balance and calculate remaining trading capacity."""
+        try:
+            total_balance, available_balance = self.wallet.get_usd_balances()
+            max_trading_balance = total_balance * 0.5  # 50% of total balance
+            used_balance = total_balance - available_balance
+            remaining_trading_balance = max_trading_balance - used_balance
+            
+            # Thousands-separated amounts need str.format, so only build them when INFO is on
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"Total Balance: ${total_balance:,.2f}")
+                self.logger.info(f"Max Trading Balance (50%): ${max_trading_balance:,.2f}")
+                self.logger.info(f"Used Balance: ${used_balance:,.2f}")
+                self.logger.info(f"Remaining Trading Balance: ${remaining_trading_balance:,.2f}")
+            
+            return max(0.0, remaining_trading_balance)  # Don't return negative balance
+        except Exception as e:
+            self.logger.error("Error getting balance: %s", e)
+            return 0.0
+
+    def get_signals(self) -> List[Dict]:
+        """Fetch active trading signals."""
+        self.logger.info("Fetching trading signals...")
+        return self.signals.get_active_signals()
+
+    def get_margin_requirements(self, refresh_products: bool = False) -> Optional[List[Dict]]:
+        """Fetch margin requirements for USD perpetual futures."""
+        self.logger.info("Fetching margin requirements...")
+        return self.margin_checker.get_margin_requirements(refresh_products=refresh_products)
+
+    def get_trading_opportunities(
+        self,
+        trading_balance: float,
+        signals: Optional[List[Dict]] = None,
+        margin_requirements: Optional[List[Dict]] = None
+    ) -> List[Dict]:
+        """Get trading opportunities based on signals and margin requirements.
+
+        Signals and margin requirements are fetched here unless the caller already has them.
+        """
+        try:
+            # Fetch whatever the caller did not supply; the two requests are independent
+            if signals is None or margin_requirements is None:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    signals_future = executor.submit(self.get_signals) if signals is None else None
+                    margin_future = (executor.submit(self.get_margin_requirements)
+                                     if margin_requirements is None else None)
+                if signals_future is not None:
+                    signals = signals_future.result()
+                if margin_future is not None:
+                    margin_requirements = margin_future.result()
+
+            # Check active signals
+            if not signals:
+                self.logger.info("No active signals found")
+                return []
+
+            # Check margin requirements
+            if not margin_requirements:
+                self.logger.error("Failed to get margin requirements")
+                return []
+
+            # Create margin lookup dictionary
+            # Each item is a single-key dict like {'BTCUSD': '$5000.00'}
+            margin_lookup = {}
+            for item in margin_requirements:
+                symbol, margin = next(iter(item.items()))
+                margin_lookup[symbol] = float(margin.lstrip('$'))
+
+            signal_map = {}
+            for signal in signals:
+                symbol, direction = next(iter(signal.items()))
+                signal_map[symbol] = direction
+
+            # Only symbols with both a signal and a known margin can qualify;
+            # filter those on available balance
+            opportunities = []
+            for symbol in signal_map.keys() & margin_lookup.keys():
+                direction = signal_map[symbol]
+                margin_required = margin_lookup[symbol]
+                
+                if margin_required <= trading_balance:
+                    opportunities.append({
+                        'symbol': symbol,
+                        'direction': direction,
+                        'margin_required': margin_required
+                    })
+
+            return opportunities
+
+        except Exception as e:
+            self.logger.error("Error getting trading opportunities: %s", e)
+            return []
+
+    def get_existing_positions(self, refresh_products: bool = False) -> Optional[Set[Tuple[str, str]]]:
+        """Get (symbol, direction) keys of currently open positions, or None if they could not be fetched."""
+        try:
+            self.logger.info("Fetching existing positions...")
+            positions = self.positions_fetcher.get_open_positions(refresh_products=refresh_products)
+            if positions is None:
+                self.logger.error("Could not fetch existing positions")
+                return None
+            
+            position_keys = set()
+            for position in positions:
+                symbol = position['product_symbol']
+                size = float(position['position'].get('size', 0))
+                if size != 0:  # Only consider non-zero positions
+                    direction = 'LONG' if size > 0 else 'SHORT'
+                    position_keys.add((symbol, direction))  # Include direction in key
+                    self.logger.info("Found existing position: %s %s", symbol, direction)
+                    
+            self.logger.info("Found %s existing positions", len(position_keys))
+            return position_keys
+            
+        except Exception as e:
+            self.logger.error("Error fetching existing positions: %s", e)
+            return None
+
+    def execute_trades(self, opportunities: List[Dict], existing_positions: Optional[Set[Tuple[str, str]]] = None):
+        """Execute trades for the identified opportunities, avoiding duplicate positions."""
+        # Get product mapping if not already available
+        if not self.product_mapping:
+            self.product_mapping = self.get_product_mapping()
+            if not self.product_mapping:
+                self.logger.error("Failed to get product mapping. Cannot execute trades.")
+                return
+
+        # Get existing positions
+        if existing_positions is None:
+            existing_positions = self.get_existing_positions()
+            if existing_positions is None:
+                # Without the held positions every opportunity could duplicate an open one
+                self.logger.error("Failed to get existing positions. Cannot execute trades.")
+                return
+        
+        # Filter out opportunities where we already have same direction positions
+        opp_by_key = {(opp['symbol'], opp['direction']): opp for opp in opportunities}
+        held_keys = opp_by_key.keys() & existing_positions
+        if held_keys:
+            self.logger.info("Skipping %d opportunities - Already have these direction positions: %s",
+                             len(held_keys), sorted(held_keys))
+        filtered_opportunities = [opp_by_key[key] for key in opp_by_key.keys() - held_keys]
+            
+        if not filtered_opportunities:
+            self.logger.info("No new opportunities to trade after filtering existing positions")
+            return
+            
+        self.logger.info("Found %s new opportunities after filtering existing positions", len(filtered_opportunities))
+            
+        # Resolve product IDs and sizes up front, then submit the independent orders concurrently
+        orders = []
+        for opp in filtered_opportunities:
+            symbol = opp['symbol']
+            self.logger.info("Placing %s order for %s", opp['direction'], symbol)
+            
+            # Get product ID from mapping
+            product_id = self.product_mapping.get(symbol)
+            if not product_id:
+                self.logger.error("Could not find product ID for symbol %s", symbol)
+                continue
+            
+            # Determine size based on symbol
+            size = self.size_overrides.get(symbol, self.DEFAULT_SIZE)
+            
+            self.logger.info("Setting order size to %s for %s", size, symbol)
+            orders.append((symbol, product_id, size, 'buy' if opp['direction'] == 'LONG' else 'sell'))
+
+        if not orders:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(len(orders), 8)) as executor:
+            futures = {
+                executor.submit(
+                    self.exchange.place_order,
+                    product_id=product_id,
+                    size=size,  # Dynamic size based on symbol
+                    order_type='market_order',
+                    side=side
+                ): (symbol, size)
+                for symbol, product_id, size, side in orders
+            }
+            
+            for future in as_completed(futures):
+                symbol, size = futures[future]
+                try:
+                    response = future.result()
+                    if response.get('success'):
+                        self.logger.info("Successfully placed order for %s with size %s", symbol, size)
+                    else:
+                        self.logger.error("Failed to place order for %s: %s", symbol, response)
+                except Exception as e:
+                    self.logger.error("Error executing trade for %s: %s", symbol, e)
+
+    def run(self):
+        """Main trading system execution."""
+        try:
+            self.logger.info("Starting Delta Trading System")
+            
+            # --refresh-mapping bypasses the product caches on the first cycle only
+            refresh = self.refresh_mapping
+            self.refresh_mapping = False
+            
+            # Balance, signals, margins, positions and product mapping are independent
+            # round-trips, so fetch them concurrently instead of one after another
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                balance_future = executor.submit(self.get_available_balance)
+                signals_future = executor.submit(self.get_signals)
+                margin_future = executor.submit(self.get_margin_requirements, refresh)
+                positions_future = executor.submit(self.get_existing_positions, refresh)
+                mapping_future = (None if self.product_mapping and not refresh
+                                  else executor.submit(self.get_product_mapping, refresh))
+
+            if mapping_future is not None:
+                self.product_mapping = mapping_future.result()
+
+            # Get available balance
+            trading_balance = balance_future.result()
+            if trading_balance <= 0:
+                self.logger.error("Insufficient balance for trading")
+                return
+
+            # Get trading opportunities
+            opportunities = self.get_trading_opportunities(
+                trading_balance, signals_future.result(), margin_future.result() or []
+            )
+            if not opportunities:
+                self.logger.info("No suitable trading opportunities found")
+                return
+
+            # Execute trades
+            self.execute_trades(opportunities, positions_future.result())
+            
+            self.logger.info("Trading system execution completed")
+
+        except Exception as e:
+            self.logger.error("Error in main execution: %s", e)
+
+    def run_forever(self, interval: float = 60, align: bool = False):
+        """Run the trading cycle every `interval` seconds in one long-lived process.
+
+        Sessions, caches and the logger stay warm between cycles instead of being rebuilt
+        by a fresh process on every cron tick. With `align`, cycles start on wall-clock
+        multiples of `interval` (e.g. candle opens for interval=60).
+        """
+        self.logger.info("Running trading loop every %s seconds", interval)
+        mapping_loaded_at = time.monotonic()
+        try:
+            while True:
+                if align:
+                    time.sleep(interval - (time.time() % interval))
+                started = time.monotonic()
+                
+                # Drop the in-memory mapping once it is as old as the disk cache TTL
+                if started - mapping_loaded_at > PRODUCT_MAPPING_TTL:
+                    self.product_mapping = {}
+                    mapping_loaded_at = started
+                
+                self.run()
+                
+                if not align:
+                    time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            self.logger.info("Trading loop stopped by user")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delta Exchange trading system")
+    parser.add_argument('--refresh-mapping', action='store_true',
+                        help="ignore the cached product list and mapping and fetch them again")
+    parser.add_argument('--loop', action='store_true',
+                        help="keep running, repeating the trading cycle every --interval seconds")
+    parser.add_argument('--interval', type=float, default=60,
+                        help="seconds between cycles in --loop mode (default: 60)")
+    parser.add_argument('--align', action='store_true',
+                        help="in --loop mode, start cycles on wall-clock multiples of --interval")
+    args = parser.parse_args()
+    
+    trading_system = DeltaTradingSystem(refresh_mapping=args.refresh_mapping)
+    if args.loop:
+        trading_system.run_forever(interval=args.interval, align=args.align)
+    else:
+        trading_system.run()
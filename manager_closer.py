@@ -1,592 +1,890 @@
-#### MANAGING STOP LOSSES AND CLOSING POSITIONS
-
-# This script is used to manage trailing stop losses for open positions.
-# It uses the Delta Exchange API to get the open positions and the current price.
-# It then calculates the stop loss price based on the current price and the stop loss percentage.
-# If the price moves in the opposite direction of the position, the stop loss is updated.
-# If the price moves in the same direction as the position, the stop loss is not updated.
-# It also checks if stop losses have been hit and closes positions accordingly.
-
-import json
-import time
-import os
-from datetime import datetime
-from typing import Dict, List, Optional
-from src.trading.open_positions_fetcher import OpenPositionsFetcher
-import logging
-from dotenv import load_dotenv
-import requests
-import hmac
-import hashlib
-from src.trading.place_order import DeltaExchange
-import websocket
-import threading
-
-load_dotenv()
-
-class TrailingStopManager:
-    def __init__(self, api_key: str, api_secret: str, stop_loss_percentage: float = 2.0):
-        # Get script directory for file paths
-        self.script_dir = os.path.dirname(os.path.realpath(__file__))
-        
-        # Setup logging first
-        self.logger = self._setup_logger()
-        
-        self.api_key = api_key
-        self.api_secret = api_secret
-        self.stop_loss_percentage = stop_loss_percentage
-        
-        # Set positions file path relative to script directory
-        self.positions_file = os.path.join(self.script_dir, 'positions_data.json')
-        self.logger.info(f"Using positions file at: {self.positions_file}")
-        
-        self.positions_fetcher = OpenPositionsFetcher(api_key, api_secret)
-        self.exchange = DeltaExchange()
-        self.base_url = 'https://api.india.delta.exchange'
-        self.product_mapping = {}
-
-    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> tuple[str, str]:
-        """Generate signature for API authentication."""
-        try:
-            timestamp = str(int(time.time())+3)
-            signature_data = method + timestamp + endpoint + payload
-            message = bytes(signature_data, 'utf-8')
-            secret = bytes(self.api_secret, 'utf-8')
-            hash = hmac.new(secret, message, hashlib.sha256)
-            return hash.hexdigest(), timestamp
-        except Exception as e:
-            self.logger.error(f"Error generating signature: {str(e)}")
-            raise
-
-    def _get_current_price(self, symbol: str) -> float:
-        """Get current price for a symbol from Delta Exchange."""
-        try:
-            self.logger.info(f"Attempting to get price for {symbol}...")
-            
-            # Try REST API first
-            try:
-                self.logger.info("Attempting to get price via REST API...")
-                # Get current timestamp
-                end_time = int(time.time())
-                start_time = end_time - 60  # Last minute
-                
-                # Build query for candles endpoint
-                query_string = f'resolution=1m&symbol={symbol}&start={start_time}&end={end_time}'
-                endpoint = f'/v2/history/candles?{query_string}'
-                
-                signature, timestamp = self._generate_signature('GET', endpoint)
-                
-                headers = {
-                    'api-key': self.api_key,
-                    'signature': signature,
-                    'timestamp': timestamp,
-                    'Content-Type': 'application/json'
-                }
-                
-                response = requests.get(
-                    f'{self.base_url}/v2/history/candles?{query_string}',
-                    headers=headers,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('success') and data.get('result'):
-                        price = float(data['result'][0]['close'])
-                        self.logger.info(f"Successfully got price via REST API: {price}")
-                        return price
-                
-                self.logger.warning("Failed to get price via REST API, falling back to WebSocket...")
-                
-            except Exception as e:
-                self.logger.error(f"REST API error: {str(e)}, falling back to WebSocket...")
-            
-            # Fallback to WebSocket
-            self.logger.info("Attempting to get price via WebSocket...")
-            self.current_price = 0
-            
-            def on_message(ws, message):
-                try:
-                    data = json.loads(message)
-                    if data.get('type') == 'candlestick_1m' and data.get('symbol') == symbol:
-                        self.current_price = float(data.get('close', 0))
-                        self.logger.info(f"Received price via WebSocket: {self.current_price}")
-                        ws.close()
-                except Exception as e:
-                    self.logger.error(f"WebSocket message error: {str(e)}")
-
-            def on_error(ws, error):
-                self.logger.error(f"WebSocket error: {error}")
-
-            def on_close(ws, close_status_code, close_msg):
-                self.logger.info(f"WebSocket closed: {close_status_code} - {close_msg}")
-
-            def on_open(ws):
-                self.logger.info("WebSocket opened")
-                subscribe_payload = {
-                    "type": "subscribe",
-                    "payload": {
-                        "channels": [
-                            {
-                                "name": "candlestick_1m",
-                                "symbols": [symbol]
-                            }
-                        ]
-                    }
-                }
-                ws.send(json.dumps(subscribe_payload))
-
-            ws = websocket.WebSocketApp(
-                "wss://socket.india.delta.exchange",
-                on_message=on_message,
-                on_error=on_error,
-                on_close=on_close,
-                on_open=on_open
-            )
-
-            ws_thread = threading.Thread(target=ws.run_forever)
-            ws_thread.daemon = True
-            ws_thread.start()
-            
-            timeout = 5
-            start_time = time.time()
-            while time.time() - start_time < timeout and self.current_price == 0:
-                time.sleep(0.1)
-            
-            ws.close()
-            
-            if self.current_price > 0:
-                return self.current_price
-            
-            self.logger.error(f"Failed to get price for {symbol}")
-            return 0
-
-        except Exception as e:
-            self.logger.error(f"Error in price fetching: {str(e)}")
-            return 0
-
-    def _load_positions_data(self) -> Dict:
-        """Load positions data from JSON file."""
-        try:
-            if os.path.exists(self.positions_file):
-                with open(self.positions_file, 'r') as f:
-                    try:
-                        data = json.load(f)
-                        self.logger.info(f"Successfully loaded positions data from {self.positions_file}")
-                        return data
-                    except json.JSONDecodeError as je:
-                        self.logger.error(f"JSON decode error: {str(je)}. Creating new positions data.")
-                        return {"positions": {}}
-            else:
-                self.logger.warning(f"Positions file not found at {self.positions_file}. Creating new file.")
-                return {"positions": {}}
-        except Exception as e:
-            self.logger.error(f"Error loading positions data from {self.positions_file}: {str(e)}")
-            return {"positions": {}}
-
-    def _save_positions_data(self, data: Dict):
-        """Save positions data to JSON file with verification."""
-        MAX_RETRIES = 3
-        retry_count = 0
-        
-        while retry_count < MAX_RETRIES:
-            try:
-                # Log attempt details
-                self.logger.info(f"Save attempt {retry_count + 1} of {MAX_RETRIES}")
-                self.logger.info(f"Using positions file: {self.positions_file}")
-                
-                # Create backup directory if it doesn't exist
-                backup_dir = os.path.join(self.script_dir, '.backup')
-                os.makedirs(backup_dir, exist_ok=True)
-                
-                # Create timestamped backup if file exists
-                if os.path.exists(self.positions_file):
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    backup_file = os.path.join(backup_dir, f'positions_data_{timestamp}.json')
-                    self.logger.info(f"Creating backup at: {backup_file}")
-                    with open(self.positions_file, 'r') as src, open(backup_file, 'w') as dst:
-                        json.dump(json.load(src), dst, indent=4)
-                
-                # Create temp directory if it doesn't exist
-                temp_dir = os.path.join(self.script_dir, '.temp')
-                os.makedirs(temp_dir, exist_ok=True)
-                
-                # Save with temporary file in temp directory
-                temp_file = os.path.join(temp_dir, f'positions_data_{int(time.time())}.json')
-                self.logger.info(f"Writing to temp file: {temp_file}")
-                
-                with open(temp_file, 'w') as f:
-                    json.dump(data, f, indent=4)
-                
-                # Verify temp file
-                if not os.path.exists(temp_file):
-                    raise Exception("Failed to create temporary file")
-                
-                with open(temp_file, 'r') as f:
-                    written_data = json.load(f)
-                    if written_data != data:
-                        raise Exception("Data verification failed for temp file")
-                
-                # Atomic replace
-                os.replace(temp_file, self.positions_file)
-                
-                # Final verification
-                with open(self.positions_file, 'r') as f:
-                    final_data = json.load(f)
-                    if final_data != data:
-                        raise Exception("Final data verification failed")
-                
-                self.logger.info("File saved and verified successfully")
-                
-                # Clean up temp directory
-                try:
-                    for f in os.listdir(temp_dir):
-                        os.remove(os.path.join(temp_dir, f))
-                    os.rmdir(temp_dir)
-                except Exception as e:
-                    self.logger.warning(f"Could not clean up temp directory: {e}")
-                
-                # Keep only last 5 backups
-                try:
-                    backups = sorted([f for f in os.listdir(backup_dir) if f.startswith('positions_data_')])
-                    if len(backups) > 5:
-                        for old_backup in backups[:-5]:
-                            os.remove(os.path.join(backup_dir, old_backup))
-                except Exception as e:
-                    self.logger.warning(f"Could not clean up old backups: {e}")
-                
-                return  # Success, exit the retry loop
-                
-            except Exception as e:
-                retry_count += 1
-                self.logger.error(f"Save attempt {retry_count} failed: {str(e)}")
-                
-                # On last retry, try to restore from backup
-                if retry_count == MAX_RETRIES and os.path.exists(f"{self.positions_file}.bak"):
-                    try:
-                        self.logger.info("Attempting to restore from backup")
-                        os.replace(f"{self.positions_file}.bak", self.positions_file)
-                        self.logger.info("Restored from backup successfully")
-                    except Exception as restore_error:
-                        self.logger.error(f"Failed to restore from backup: {str(restore_error)}")
-                
-                if retry_count < MAX_RETRIES:
-                    self.logger.info(f"Retrying in 1 second...")
-                    time.sleep(1)
-                else:
-                    self.logger.error("All save attempts failed")
-                    raise Exception("Failed to save positions data after all retries")
-
-    def _calculate_stop_loss(self, current_price: float, entry_price: float, size: float) -> float:
-        """Calculate stop loss price based on fixed difference from entry price."""
-        # Calculate fixed difference based on entry price
-        stop_diff = entry_price * (self.stop_loss_percentage / 100)
-        
-        if size > 0:  # Long position
-            # For long positions, maintain fixed difference below current price
-            return round(current_price - stop_diff, 5)
-        else:  # Short position
-            # For short positions, maintain fixed difference above current price
-            return round(current_price + stop_diff, 5)
-
-    def _should_update_stop_loss(self, current_price: float, current_stop_loss: float, entry_price: float, size: float) -> bool:
-        """Check if stop loss should be updated based on fixed difference from entry price."""
-        # Calculate fixed difference based on entry price
-        stop_diff = entry_price * (self.stop_loss_percentage / 100)
-        
-        if size > 0:  # Long position
-            # For long positions, update if new stop loss would be higher
-            new_stop_loss = current_price - stop_diff
-            return new_stop_loss > current_stop_loss
-        else:  # Short position
-            # For short positions, update if new stop loss would be lower
-            new_stop_loss = current_price + stop_diff
-            return new_stop_loss < current_stop_loss
-
-    def get_product_mapping(self) -> Dict[str, int]:
-        """Get mapping of symbol to product ID from Delta Exchange."""
-        try:
-            self.logger.info("Fetching product mapping from Delta Exchange...")
-            
-            # Use the existing method from OpenPositionsFetcher
-            products = self.positions_fetcher._get_all_usd_products()
-            
-            if not products:
-                self.logger.error("Failed to fetch product mapping")
-                return {}
-                
-            # Create mapping from the products list
-            mapping = {product['symbol']: product['id'] for product in products}
-            self.logger.info(f"Successfully fetched product mapping for {len(mapping)} symbols")
-            return mapping
-            
-        except Exception as e:
-            self.logger.error(f"Error getting product mapping: {str(e)}")
-            return {}
-
-    def manage_stop_losses(self):
-        """Main function to manage trailing stop losses and close positions if stop loss is hit."""
-        try:
-            print(f"\n=== Trailing Stop Manager Run at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===")
-            
-            # Get product mapping if not already available
-            if not self.product_mapping:
-                self.product_mapping = self.get_product_mapping()
-                if not self.product_mapping:
-                    self.logger.error("Failed to get product mapping. Cannot manage stop losses.")
-                    return
-            
-            # Load existing positions data
-            positions_data = self._load_positions_data()
-            stored_positions = positions_data.get("positions", {})
-            
-            # Get current open positions
-            current_positions = self.positions_fetcher.get_open_positions()
-            current_symbols = {pos['product_symbol'] for pos in current_positions}
-            
-            # Process each current position
-            for position in current_positions:
-                symbol = position['product_symbol']
-                pos_data = position['position']
-                entry_price = float(pos_data.get('entry_price', 0))
-                size = float(pos_data.get('size', 0))
-                
-                # Get product ID from mapping
-                product_id = self.product_mapping.get(symbol)
-                if not product_id:
-                    self.logger.error(f"Could not find product ID for symbol {symbol}")
-                    continue
-                
-                # Get current price from WebSocket
-                current_price = self._get_current_price(symbol)
-                
-                # Skip if current price is 0
-                if current_price == 0:
-                    self.logger.warning(f"Skipping position management for {symbol} due to invalid current price (0)")
-                    continue
-                
-                if symbol not in stored_positions:
-                    # New position - set initial stop loss based on entry price
-                    initial_stop_loss = self._calculate_stop_loss(entry_price, entry_price, size)
-                    position_data = {
-                        'entry_price': entry_price,
-                        'current_price': current_price,
-                        'stop_loss': initial_stop_loss,
-                        'size': size,
-                        'stop_loss_updates': 0,
-                        'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    stored_positions[symbol] = position_data
-                    
-                    # Log new position details
-                    self.logger.info(
-                        f"New position added: {symbol}\n"
-                        f"  Type: {'Long' if size > 0 else 'Short'}\n"
-                        f"  Entry Price: {entry_price}\n"
-                        f"  Current Price: {current_price}\n"
-                        f"  Initial Stop Loss: {initial_stop_loss}\n"
-                        f"  Size: {size}"
-                    )
-                    
-                    print(f"\nNew position detected: {symbol}")
-                    print(f"Position Type: {'Long' if size > 0 else 'Short'}")
-                    print(f"Entry Price: {entry_price}")
-                    print(f"Current Price: {current_price}")
-                    print(f"Initial stop loss set at: {initial_stop_loss}")
-                else:
-                    # Update current price in stored position
-                    stored_pos = stored_positions[symbol]
-                    stored_pos['current_price'] = current_price
-                    
-                    # Check if stop loss is hit
-                    if size > 0:  # Long position
-                        if current_price <= stored_pos['stop_loss']:
-                            print(f"\nStop loss hit for {symbol} (Long position)")
-                            print(f"Current Price: {current_price}")
-                            print(f"Stop Loss: {stored_pos['stop_loss']}")
-                            
-                            # Close position by placing a sell order
-                            response = self.exchange.place_order(
-                                product_id=product_id,
-                                size=abs(size),
-                                order_type='market_order',
-                                side='sell'
-                            )
-                            
-                            if response.get('success'):
-                                print(f"Successfully closed long position for {symbol}")
-                                del stored_positions[symbol]
-                            else:
-                                print(f"Failed to close position for {symbol}: {response}")
-                        elif self._should_update_stop_loss(current_price, stored_pos['stop_loss'], stored_pos['entry_price'], size):
-                            # Update trailing stop loss for long position
-                            old_stop_loss = stored_pos['stop_loss']
-                            new_stop_loss = self._calculate_stop_loss(current_price, stored_pos['entry_price'], size)
-                            stored_pos['stop_loss'] = new_stop_loss
-                            stored_pos['stop_loss_updates'] += 1
-                            stored_pos['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            
-                            # Log stop loss update
-                            self.logger.info(
-                                f"Updated long stop loss for {symbol}\n"
-                                f"  Old Stop Loss: {old_stop_loss}\n"
-                                f"  New Stop Loss: {new_stop_loss}\n"
-                                f"  Current Price: {current_price}\n"
-                                f"  Update Count: {stored_pos['stop_loss_updates']}"
-                            )
-                            
-                            print(f"\nUpdated stop loss for {symbol}")
-                            print(f"Position Type: Long")
-                            print(f"Current Price: {current_price}")
-                            print(f"New stop loss: {new_stop_loss}")
-                    else:  # Short position
-                        if current_price >= stored_pos['stop_loss']:
-                            print(f"\nStop loss hit for {symbol} (Short position)")
-                            print(f"Current Price: {current_price}")
-                            print(f"Stop Loss: {stored_pos['stop_loss']}")
-                            
-                            # Close position by placing a buy order
-                            response = self.exchange.place_order(
-                                product_id=product_id,
-                                size=abs(size),
-                                order_type='market_order',
-                                side='buy'
-                            )
-                            
-                            if response.get('success'):
-                                print(f"Successfully closed short position for {symbol}")
-                                del stored_positions[symbol]
-                            else:
-                                print(f"Failed to close position for {symbol}: {response}")
-                        elif self._should_update_stop_loss(current_price, stored_pos['stop_loss'], stored_pos['entry_price'], size):
-                            # Update trailing stop loss for short position
-                            old_stop_loss = stored_pos['stop_loss']
-                            new_stop_loss = self._calculate_stop_loss(current_price, stored_pos['entry_price'], size)
-                            stored_pos['stop_loss'] = new_stop_loss
-                            stored_pos['stop_loss_updates'] += 1
-                            stored_pos['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            
-                            # Log stop loss update
-                            self.logger.info(
-                                f"Updated short stop loss for {symbol}\n"
-                                f"  Old Stop Loss: {old_stop_loss}\n"
-                                f"  New Stop Loss: {new_stop_loss}\n"
-                                f"  Current Price: {current_price}\n"
-                                f"  Update Count: {stored_pos['stop_loss_updates']}"
-                            )
-                            
-                            print(f"\nUpdated stop loss for {symbol}")
-                            print(f"Position Type: Short")
-                            print(f"Current Price: {current_price}")
-                            print(f"New stop loss: {new_stop_loss}")
-            
-            # Remove closed positions
-            closed_positions = set(stored_positions.keys()) - current_symbols
-            for symbol in closed_positions:
-                position = stored_positions[symbol]
-                self.logger.info(
-                    f"Position closed: {symbol}\n"
-                    f"  Type: {'Long' if position['size'] > 0 else 'Short'}\n"
-                    f"  Entry Price: {position['entry_price']}\n"
-                    f"  Final Price: {position['current_price']}\n"
-                    f"  Stop Loss: {position['stop_loss']}\n"
-                    f"  Stop Loss Updates: {position['stop_loss_updates']}\n"
-                    f"  Last Update: {position['last_update']}"
-                )
-                print(f"\nPosition closed: {symbol}")
-                del stored_positions[symbol]
-            
-            # Save updated positions data
-            positions_data["positions"] = stored_positions
-            self._save_positions_data(positions_data)
-            
-            # Print summary
-            print("\n=== Current Positions Summary ===")
-            for symbol, pos_data in stored_positions.items():
-                print(f"\nSymbol: {symbol}")
-                print(f"Position Type: {'Long' if pos_data['size'] > 0 else 'Short'}")
-                print(f"Entry Price: {pos_data['entry_price']}")
-                print(f"Current Price: {pos_data['current_price']}")
-                print(f"Stop Loss: {pos_data['stop_loss']}")
-                print(f"Size: {pos_data['size']}")
-                print(f"Stop Loss Updates: {pos_data['stop_loss_updates']}")
-                print(f"Last Update: {pos_data['last_update']}")
-                print("-------------------")
-
-            print("\n=== Stop Loss Check Complete ===")
-            print(f"Checked {len(current_positions)} positions for stop loss hits")
-            print(f"Successfully managed {len(stored_positions)} active positions")
-
-        except Exception as e:
-            self.logger.error(f"Error in manage_stop_losses: {str(e)}")
-            print(f"Error occurred: {str(e)}")
-
-    def _setup_logger(self):
-        """Setup logging configuration."""
-        logger = logging.getLogger('TrailingStopManager')
-        logger.setLevel(logging.INFO)
-        
-        # Create logs directory relative to script directory
-        log_dir = os.path.join(self.script_dir, 'logs')
-        try:
-            os.makedirs(log_dir, exist_ok=True)
-            print(f"Using log directory: {log_dir}")
-        except Exception as e:
-            print(f"Warning: Could not create log directory: {e}")
-            log_dir = self.script_dir  # Fallback to script directory
-        
-        # Create formatters and handlers
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        
-        # File handler
-        file_handler = logging.FileHandler(
-            os.path.join(log_dir, f'trailing_stop_{datetime.now().strftime("%Y%m%d")}.log')
-        )
-        file_handler.setFormatter(formatter)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        
-        # Remove any existing handlers to avoid duplicates
-        if logger.hasHandlers():
-            logger.handlers.clear()
-        
-        # Add handlers
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-        
-        return logger
-
-def main():
-    # Setup basic logging for main function
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    logger = logging.getLogger('main')
-    
-    try:
-        # Load environment variables
-        load_dotenv()
-        
-        api_key = os.getenv('API_KEY')
-        api_secret = os.getenv('API_SECRET')
-        
-        if not api_key or not api_secret:
-            logger.error("API credentials not found in environment variables")
-            return
-        
-        logger.info("Starting TrailingStopManager")
-        manager = TrailingStopManager(api_key, api_secret)
-        
-        # Run the manager
-        manager.manage_stop_losses()
-        
-    except KeyboardInterrupt:
-        logger.info("Program interrupted by user")
-    except Exception as e:
-        logger.error(f"Program terminated due to error: {str(e)}")
-
-if __name__ == "__main__":
-    main()
+#### MANAGING STOP LOSSES AND CLOSING POSITIONS
+
+# This script is used to manage trailing stop losses for open positions.
+# It uses the Delta Exchange API to get the open positions and the current price.
+# It then calculates the stop loss price based on the current price and the stop loss percentage.
+# If the price moves in the opposite direction of the position, the stop loss is updated.
+# If the price moves in the same direction as the position, the stop loss is not updated.
+# It also checks if stop losses have been hit and closes positions accordingly.
+
+import argparse
+import atexit
+import queue
+import signal
+import sys
+import orjson
+import time
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.trading.open_positions_fetcher import OpenPositionsFetcher
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+import math
+from src.trading.place_order import DeltaExchange
+from src.utils.file_cache import FileCache
+from src.utils.rate_limiter import host_bucket
+from src.utils.server_clock import signing_timestamp
+from src.utils.signing import HmacSha256
+import websocket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+load_dotenv()
+
+WS_URL = "wss://socket.india.delta.exchange"
+
+# Product IDs change rarely (new listings), so the symbol mapping is cached on disk
+PRODUCT_MAPPING_TTL = 60 * 60
+
+class TrailingStopManager:
+    # Compact the positions change log after this many entries or bytes
+    WAL_MAX_ENTRIES = 100
+    WAL_MAX_BYTES = 1_000_000
+
+    def __init__(self, api_key: str, api_secret: str, stop_loss_percentage: float = 2.0,
+                 price_max_age: float = 5.0, fetch_skip_margin: float = 0.0025, skip_ttl: float = 30.0):
+        # Get script directory for file paths
+        self.script_dir = os.path.dirname(os.path.realpath(__file__))
+        
+        # Setup logging first
+        self.logger = self._setup_logger()
+        
+        self.api_key = api_key
+        self.api_secret = api_secret
+        # Keyed HMAC state prepared once; each signature copies it instead of redoing the key setup
+        self._signer = HmacSha256(api_secret.encode('utf-8'))
+        self.stop_loss_percentage = stop_loss_percentage
+        self._stop_fraction = stop_loss_percentage / 100.0
+        
+        # Set positions file path relative to script directory
+        self.positions_file = os.path.join(self.script_dir, 'positions_data.json')
+        self.logger.info("Using positions file at: %s", self.positions_file)
+        
+        # Append-only log of position changes since the last snapshot
+        self.wal_file = os.path.join(self.script_dir, 'positions_data.jsonl')
+        self._wal_entries = 0
+        
+        # Working directories for atomic saves and backups, created once
+        self.temp_dir = os.path.join(self.script_dir, '.temp')
+        self.backup_dir = os.path.join(self.script_dir, '.backup')
+        os.makedirs(self.temp_dir, exist_ok=True)
+        os.makedirs(self.backup_dir, exist_ok=True)
+        
+        # Snapshot + change log are read once; afterwards the in-memory state is authoritative
+        self._positions_state = self._load_positions_data()
+        
+        cache_dir = os.path.join(self.script_dir, 'cache')
+        self.positions_fetcher = OpenPositionsFetcher(api_key, api_secret, cache_dir=cache_dir)
+        self.exchange = DeltaExchange()
+        self.base_url = 'https://api.india.delta.exchange'
+        self.session = self._setup_requests_session()  # Reuse connections for price requests
+        self.rate_limiter = host_bucket(self.base_url)  # Shared with the positions fetcher and order client
+        self.product_mapping = {}
+        self._mapping_loaded_at = 0.0
+        self.cache = FileCache(cache_dir)
+        
+        # Latest known prices from the WebSocket stream and REST reads: symbol -> (price, monotonic time)
+        self.price_cache: Dict[str, Tuple[float, float]] = {}
+        self.price_max_age = price_max_age
+        # Positions further than this fraction on the safe side of their stop may reuse a price up to skip_ttl seconds old
+        self.fetch_skip_margin = fetch_skip_margin
+        self.skip_ttl = skip_ttl
+        self._ws_lock = threading.Lock()
+        self._subscribed = set()
+        self._ws = None
+        self._ws_thread = None
+        self._ws_stop = threading.Event()
+        self._price_events: Dict[str, threading.Event] = {}
+        
+        # Single background worker for positions file backups
+        self._backup_pool = ThreadPoolExecutor(max_workers=1)
+        
+        # Close orders for positions that hit their stop go out concurrently
+        self._order_pool = ThreadPoolExecutor(max_workers=8)
+
+    def _setup_requests_session(self) -> requests.Session:
+        """Setup requests session with retries."""
+        session = requests.Session()
+        
+        # Retry transient failures with exponential backoff (0.1, 0.2, 0.4 seconds)
+        retries = Retry(
+            total=3,
+            backoff_factor=0.1,
+            status_forcelist=[408, 429, 500, 502, 503, 504],
+        )
+        
+        # Add retry adapter to session; keep enough pooled connections for concurrent callers
+        adapter = HTTPAdapter(max_retries=retries, pool_maxsize=8)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Content-Type': 'application/json'})
+        
+        return session
+
+    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> tuple[str, str]:
+        """Generate signature for API authentication."""
+        try:
+            timestamp = signing_timestamp(self.base_url)
+            message = f'{method}{timestamp}{endpoint}{payload}'.encode('utf-8')
+            return self._signer.hexdigest(message), timestamp
+        except Exception as e:
+            self.logger.error("Error generating signature: %s", e)
+            raise
+
+    def _start_price_stream(self):
+        """Start the background thread that owns the price WebSocket."""
+        self._ws_thread = threading.Thread(target=self._run_price_stream, name='price-stream', daemon=True)
+        self._ws_thread.start()
+
+    def _run_price_stream(self):
+        """Keep one WebSocket open for all symbols, reconnecting with exponential backoff."""
+        backoff = 1
+        while not self._ws_stop.is_set():
+            ws = websocket.WebSocketApp(
+                WS_URL,
+                on_open=self._on_open,
+                on_message=self._on_tick,
+                on_error=self._on_error,
+                on_close=self._on_close
+            )
+            with self._ws_lock:
+                self._ws = ws
+            
+            connected_at = time.monotonic()
+            ws.run_forever(ping_interval=20, ping_timeout=10)
+            if self._ws_stop.is_set():
+                break
+            
+            # A connection that stayed up for a while resets the backoff
+            if time.monotonic() - connected_at > 60:
+                backoff = 1
+            self.logger.warning("Price stream disconnected, reconnecting in %ss", backoff)
+            self._ws_stop.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _send_subscription(self, ws, action: str, symbols: Iterable[str]):
+        """Send one subscribe/unsubscribe frame covering all given symbols."""
+        payload = {
+            "type": action,
+            "payload": {
+                "channels": [
+                    {
+                        "name": "v2/ticker",
+                        "symbols": sorted(symbols)
+                    }
+                ]
+            }
+        }
+        try:
+            ws.send(orjson.dumps(payload).decode('utf-8'))
+        except Exception as e:
+            self.logger.warning("Could not %s to price stream: %s", action, e)
+
+    def _on_open(self, ws):
+        self.logger.info("Price stream connected")
+        # Re-subscribe everything after a (re)connect
+        with self._ws_lock:
+            symbols = list(self._subscribed)
+        if symbols:
+            self._send_subscription(ws, 'subscribe', symbols)
+
+    def _on_tick(self, ws, message):
+        try:
+            data = orjson.loads(message)
+            if data.get('type') == 'v2/ticker' and data.get('symbol'):
+                price = float(data.get('close') or 0)
+                if price > 0:
+                    self._cache_price(data['symbol'], price)
+                    # Wake any caller waiting for this symbol's first tick
+                    event = self._price_events.get(data['symbol'])
+                    if event is not None:
+                        event.set()
+        except Exception as e:
+            self.logger.error("WebSocket message error: %s", e)
+
+    def _on_error(self, ws, error):
+        self.logger.error("WebSocket error: %s", error)
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        self.logger.info("WebSocket closed: %s - %s", close_status_code, close_msg)
+
+    def ensure_subscribed(self, symbols: Iterable[str]):
+        """Subscribe the price stream to any symbols it is not already tracking."""
+        with self._ws_lock:
+            new_symbols = set(symbols) - self._subscribed
+            if not new_symbols:
+                return
+            self._subscribed |= new_symbols
+            if self._ws_thread is None:
+                # First subscription starts the stream; _on_open subscribes everything
+                self._start_price_stream()
+                return
+            ws = self._ws
+        
+        if ws is not None and ws.sock and ws.sock.connected:
+            self._send_subscription(ws, 'subscribe', new_symbols)
+
+    def sync_subscriptions(self, symbols: Iterable[str]):
+        """Track exactly the given symbols, sending subscribe/unsubscribe frames only for the difference."""
+        desired = set(symbols)
+        with self._ws_lock:
+            to_subscribe = desired - self._subscribed
+            to_unsubscribe = self._subscribed - desired
+            if not to_subscribe and not to_unsubscribe:
+                return
+            self._subscribed = desired
+            if self._ws_thread is None:
+                if desired:
+                    self._start_price_stream()
+                return
+            ws = self._ws
+        
+        # Prices for symbols we stop tracking would only go stale
+        for symbol in to_unsubscribe:
+            self.price_cache.pop(symbol, None)
+        
+        if ws is not None and ws.sock and ws.sock.connected:
+            if to_unsubscribe:
+                self._send_subscription(ws, 'unsubscribe', to_unsubscribe)
+            if to_subscribe:
+                self._send_subscription(ws, 'subscribe', to_subscribe)
+
+    def close(self):
+        """Shut the price stream down for good and release pooled connections and workers."""
+        self._ws_stop.set()
+        with self._ws_lock:
+            ws = self._ws
+        if ws is not None:
+            ws.close()
+        
+        self._order_pool.shutdown(wait=True)
+        self._backup_pool.shutdown(wait=True)
+        self.session.close()
+
+    def _cache_price(self, symbol: str, price: float):
+        self.price_cache[symbol] = (price, time.monotonic())
+
+    def _get_cached_price(self, symbol: str) -> float:
+        """Return the cached price for symbol if it is younger than price_max_age, otherwise 0."""
+        cached = self.price_cache.get(symbol)
+        if cached and time.monotonic() - cached[1] <= self.price_max_age:
+            return cached[0]
+        return 0
+
+    def _get_price_without_fetch(self, symbol: str, stop_loss: Optional[float], size: float) -> float:
+        """Return a fresh cached price, or a recent one when the position is safely away from its stop; otherwise 0."""
+        price = self._get_cached_price(symbol)
+        if price > 0 or stop_loss is None:
+            return price
+        
+        cached = self.price_cache.get(symbol)
+        if cached and time.monotonic() - cached[1] <= self.skip_ttl:
+            price = cached[0]
+            # Only a price well on the safe side of the stop may be reused; near or past it, fetch again
+            direction = 1.0 if size > 0 else -1.0
+            if (price - stop_loss) * direction / price > self.fetch_skip_margin:
+                return price
+        return 0
+
+    def _fetch_ticker_price(self, symbol: str) -> float:
+        """Fetch the latest close for symbol from the REST ticker endpoint and cache it; 0 on failure."""
+        try:
+            # Single-symbol ticker: just the latest close, no candle window to pick
+            endpoint = f'/v2/tickers/{symbol}'
+            
+            self.rate_limiter.acquire()
+            signature, timestamp = self._generate_signature('GET', endpoint)
+            
+            headers = {
+                'api-key': self.api_key,
+                'signature': signature,
+                'timestamp': timestamp
+            }
+            
+            response = self.session.get(
+                f'{self.base_url}{endpoint}',
+                headers=headers,
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                if data.get('success') and data.get('result', {}).get('close') is not None:
+                    price = float(data['result']['close'])
+                    self._cache_price(symbol, price)
+                    self.logger.info("Successfully got price via REST API: %s", price)
+                    return price
+        except Exception as e:
+            self.logger.error("REST API error for %s: %s", symbol, e)
+        return 0
+
+    def _get_current_price(self, symbol: str) -> float:
+        """Get current price for a symbol, preferring the live WebSocket price stream."""
+        try:
+            self.ensure_subscribed({symbol})
+            price = self._get_cached_price(symbol)
+            if price > 0:
+                return price
+            
+            self.logger.info("No fresh streamed price for %s, trying REST API...", symbol)
+            
+            price = self._fetch_ticker_price(symbol)
+            if price > 0:
+                return price
+            
+            self.logger.warning("Failed to get price via REST API, waiting for WebSocket...")
+            
+            # Fall back to waiting for the next streamed tick
+            event = self._price_events.setdefault(symbol, threading.Event())
+            event.clear()
+            price = self._get_cached_price(symbol)
+            if price == 0 and event.wait(timeout=5):
+                price = self._get_cached_price(symbol)
+            if price > 0:
+                self.logger.info("Received price via WebSocket: %s", price)
+                return price
+            
+            self.logger.error("Failed to get price for %s", symbol)
+            return 0
+
+        except Exception as e:
+            self.logger.error("Error in price fetching: %s", e)
+            return 0
+
+    def _fetch_all_tickers(self) -> Dict[str, float]:
+        """Get the last close price of every perpetual contract in one public REST call."""
+        try:
+            self.rate_limiter.acquire()
+            response = self.session.get(
+                f'{self.base_url}/v2/tickers',
+                params={'contract_types': 'perpetual_futures'},
+                timeout=10
+            )
+            data = orjson.loads(response.content)
+            if response.status_code != 200 or not data.get('success'):
+                self.logger.warning("Failed to fetch tickers: %s", response.status_code)
+                return {}
+            
+            return {
+                row['symbol']: float(row['close'])
+                for row in data.get('result', [])
+                if row.get('symbol') and row.get('close') is not None
+            }
+        except Exception as e:
+            self.logger.error("Error fetching tickers: %s", e)
+            return {}
+
+    def _load_positions_data(self) -> Dict:
+        """Load positions data from the JSON snapshot and replay the change log on top."""
+        data = {"positions": {}}
+        try:
+            if os.path.exists(self.positions_file):
+                with open(self.positions_file, 'rb') as f:
+                    try:
+                        data = orjson.loads(f.read())
+                        self.logger.info("Successfully loaded positions data from %s", self.positions_file)
+                    except orjson.JSONDecodeError as je:
+                        self.logger.error("JSON decode error: %s. Creating new positions data.", je)
+            else:
+                self.logger.warning("Positions file not found at %s. Creating new file.", self.positions_file)
+        except Exception as e:
+            self.logger.error("Error loading positions data from %s: %s", self.positions_file, e)
+        
+        self._replay_wal(data.setdefault("positions", {}))
+        return data
+
+    def _replay_wal(self, positions: Dict):
+        """Apply logged position changes written since the last snapshot."""
+        self._wal_entries = 0
+        if not os.path.exists(self.wal_file):
+            return
+        
+        try:
+            with open(self.wal_file, 'rb+') as f:
+                content = f.read()
+                complete = content.rfind(b'\n') + 1
+                if complete < len(content):
+                    # A torn final line from an interrupted append; cut it off so the
+                    # next append starts on a fresh line instead of being glued to it
+                    self.logger.warning("Dropping incomplete positions log entry")
+                    f.truncate(complete)
+                    f.flush()
+                    os.fsync(f.fileno())
+            
+            for line in content[:complete].splitlines():
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    self.logger.warning("Skipping unreadable positions log entry")
+                    continue
+                if entry['op'] == 'del':
+                    positions.pop(entry['sym'], None)
+                else:
+                    positions[entry['sym']] = entry['rec']
+                self._wal_entries += 1
+        except Exception as e:
+            self.logger.error("Error replaying positions log %s: %s", self.wal_file, e)
+
+    def _append_wal(self, changes: Dict[str, Optional[Dict]], data: Dict):
+        """Append changed positions (None = removed) to the log, compacting it when it grows too large."""
+        if not changes:
+            return
+        
+        lines = [
+            orjson.dumps({"sym": symbol, "op": "upd", "rec": record} if record is not None
+                         else {"sym": symbol, "op": "del"}) + b'\n'
+            for symbol, record in changes.items()
+        ]
+        with open(self.wal_file, 'ab') as f:
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self._wal_entries += len(lines)
+        
+        if self._wal_entries >= self.WAL_MAX_ENTRIES or os.path.getsize(self.wal_file) >= self.WAL_MAX_BYTES:
+            self._compact_wal(data)
+
+    def _compact_wal(self, data: Dict):
+        """Fold the log into a fresh snapshot and truncate it."""
+        # Replaying the log over the new snapshot is idempotent, so a crash
+        # between these two steps loses nothing
+        self._save_positions_data(data)
+        with open(self.wal_file, 'wb') as f:
+            os.fsync(f.fileno())
+        self._wal_entries = 0
+        self.logger.info("Compacted positions log into snapshot")
+
+    def _save_positions_data(self, data: Dict):
+        """Save positions data to JSON file atomically (write + fsync + rename)."""
+        MAX_RETRIES = 3
+        retry_count = 0
+        
+        # Serialize once; the same bytes go to the positions file and the backup
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        
+        while retry_count < MAX_RETRIES:
+            try:
+                # Write and fsync a temp file, then rename it over the positions file
+                temp_file = os.path.join(self.temp_dir, f'positions_data_{int(time.time())}.json')
+                fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                try:
+                    os.write(fd, payload)
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                os.replace(temp_file, self.positions_file)
+                
+                self.logger.info("Saved positions data to %s", self.positions_file)
+                
+                # Timestamped backup happens off the hot path
+                self._backup_pool.submit(self._write_backup, payload)
+                return  # Success, exit the retry loop
+                
+            except Exception as e:
+                retry_count += 1
+                self.logger.error("Save attempt %s failed: %s", retry_count, e)
+                
+                if retry_count < MAX_RETRIES:
+                    self.logger.info("Retrying in 1 second...")
+                    time.sleep(1)
+                else:
+                    self.logger.error("All save attempts failed")
+                    raise Exception("Failed to save positions data after all retries")
+
+    def _write_backup(self, payload: bytes):
+        """Write a timestamped backup of saved positions data, keeping the last 5."""
+        try:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            backup_file = os.path.join(self.backup_dir, f'positions_data_{timestamp}.json')
+            with open(backup_file, 'wb') as f:
+                f.write(payload)
+            
+            # Keep only last 5 backups (timestamped names sort chronologically)
+            with os.scandir(self.backup_dir) as it:
+                backups = [entry for entry in it if entry.name.startswith('positions_data_')]
+            if len(backups) > 5:
+                backups.sort(key=lambda entry: entry.name, reverse=True)
+                for old_backup in backups[5:]:
+                    os.unlink(old_backup.path)
+        except Exception as e:
+            self.logger.warning("Could not write positions backup: %s", e)
+
+    def _calculate_stop_loss(self, current_price: float, entry_price: float, size: float) -> float:
+        """Calculate stop loss price based on fixed difference from entry price."""
+        # Fixed difference below the current price for longs, above it for shorts
+        return round(current_price - math.copysign(entry_price * self._stop_fraction, size), 5)
+
+    def _evaluate_stop_loss(self, current_price: float, stop_loss: float, entry_price: float, size: float) -> Tuple[bool, Optional[float]]:
+        """Decide in one pass whether the stop loss is hit and, if not, the new trailing stop (None if unchanged)."""
+        # +1 for longs, -1 for shorts: "favourable" price moves are positive in both cases
+        direction = 1.0 if size > 0 else -1.0
+        if (current_price - stop_loss) * direction <= 0:
+            return True, None
+        
+        # Only ever trail the stop loss in the position's favour
+        new_stop_loss = self._calculate_stop_loss(current_price, entry_price, size)
+        return False, new_stop_loss if (new_stop_loss - stop_loss) * direction > 0 else None
+
+    def get_product_mapping(self) -> Dict[str, int]:
+        """Get mapping of symbol to product ID, from the disk cache when it is fresh enough."""
+        try:
+            mapping = self.cache.get('product_mapping', PRODUCT_MAPPING_TTL)
+            if mapping:
+                self.logger.info("Loaded product mapping for %s symbols from cache", len(mapping))
+                return mapping
+            
+            self.logger.info("Fetching product mapping from Delta Exchange...")
+            
+            # Use the existing method from OpenPositionsFetcher
+            products = self.positions_fetcher._get_all_usd_products()
+            
+            if not products:
+                self.logger.error("Failed to fetch product mapping")
+                return {}
+                
+            # Create mapping from the products list
+            mapping = {product['symbol']: product['id'] for product in products}
+            self.logger.info("Successfully fetched product mapping for %s symbols", len(mapping))
+            
+            try:
+                self.cache.set('product_mapping', mapping)
+            except OSError as e:
+                self.logger.warning("Could not cache product mapping: %s", e)
+            return mapping
+            
+        except Exception as e:
+            self.logger.error("Error getting product mapping: %s", e)
+            return {}
+
+    def manage_stop_losses(self):
+        """Main function to manage trailing stop losses and close positions if stop loss is hit."""
+        try:
+            # One timestamp for the whole run, reused for every position update
+            now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            print(f"\n=== Trailing Stop Manager Run at {now_str} ===")
+            
+            # Get product mapping if not already available or older than the cache TTL
+            if not self.product_mapping or time.monotonic() - self._mapping_loaded_at > PRODUCT_MAPPING_TTL:
+                self.product_mapping = self.get_product_mapping()
+                self._mapping_loaded_at = time.monotonic()
+                if not self.product_mapping:
+                    self.logger.error("Failed to get product mapping. Cannot manage stop losses.")
+                    return
+            
+            # Positions state kept in memory since startup
+            positions_data = self._positions_state
+            stored_positions = positions_data["positions"]
+            
+            # Positions changed this run: symbol -> record, or None when removed
+            dirty = {}
+            
+            # Positions that hit their stop: (symbol, product_id, size, side)
+            to_close = []
+            
+            # Get current open positions
+            current_positions = self.positions_fetcher.get_open_positions()
+            if current_positions is None:
+                # An empty list would read as "every tracked position closed" and drop their stops
+                self.logger.error("Failed to fetch open positions. Skipping this run.")
+                return
+            current_by_symbol = {pos['product_symbol']: pos for pos in current_positions}
+            current_symbols = current_by_symbol.keys()
+            
+            # Stream prices for exactly the held symbols
+            self.sync_subscriptions(current_symbols)
+            
+            # One bulk tickers call instead of a price request per position, skipped when
+            # every held symbol has a fresh price or is safely away from its stop
+            if any(not self._get_price_without_fetch(symbol, stored_positions.get(symbol, {}).get('stop_loss'),
+                                                     float(position['position'].get('size', 0)))
+                   for symbol, position in current_by_symbol.items()):
+                tickers = self._fetch_all_tickers()
+                for symbol in current_symbols & tickers.keys():
+                    self._cache_price(symbol, tickers[symbol])
+            
+            # Process each current position
+            for symbol, position in current_by_symbol.items():
+                pos_data = position['position']
+                entry_price = float(pos_data.get('entry_price', 0))
+                size = float(pos_data.get('size', 0))
+                
+                # Get product ID from mapping
+                product_id = self.product_mapping.get(symbol)
+                if not product_id:
+                    self.logger.error("Could not find product ID for symbol %s", symbol)
+                    continue
+                
+                # Cached price (stream or bulk tickers), falling back to a per-symbol lookup
+                current_price = (
+                    self._get_price_without_fetch(symbol, stored_positions.get(symbol, {}).get('stop_loss'), size)
+                    or self._get_current_price(symbol)
+                )
+                
+                # Skip if current price is 0
+                if current_price == 0:
+                    self.logger.warning("Skipping position management for %s due to invalid current price (0)", symbol)
+                    continue
+                
+                if symbol not in stored_positions:
+                    # New position - set initial stop loss based on entry price
+                    initial_stop_loss = self._calculate_stop_loss(entry_price, entry_price, size)
+                    position_data = {
+                        'entry_price': entry_price,
+                        'current_price': current_price,
+                        'stop_loss': initial_stop_loss,
+                        'size': size,
+                        'stop_loss_updates': 0,
+                        'last_update': now_str
+                    }
+                    stored_positions[symbol] = position_data
+                    dirty[symbol] = position_data
+                    
+                    # Log new position details
+                    self.logger.info(
+                        "New position added: %s\n"
+                        "  Type: %s\n"
+                        "  Entry Price: %s\n"
+                        "  Current Price: %s\n"
+                        "  Initial Stop Loss: %s\n"
+                        "  Size: %s",
+                        symbol, 'Long' if size > 0 else 'Short', entry_price,
+                        current_price, initial_stop_loss, size
+                    )
+                    
+                    print(f"\nNew position detected: {symbol}")
+                    print(f"Position Type: {'Long' if size > 0 else 'Short'}")
+                    print(f"Entry Price: {entry_price}")
+                    print(f"Current Price: {current_price}")
+                    print(f"Initial stop loss set at: {initial_stop_loss}")
+                else:
+                    # Update current price in stored position
+                    stored_pos = stored_positions[symbol]
+                    if stored_pos.get('current_price') != current_price:
+                        stored_pos['current_price'] = current_price
+                        dirty[symbol] = stored_pos
+                    
+                    # Check if stop loss is hit, or else whether it should trail
+                    is_long = size > 0
+                    position_type = 'Long' if is_long else 'Short'
+                    hit, new_stop_loss = self._evaluate_stop_loss(
+                        current_price, stored_pos['stop_loss'], stored_pos['entry_price'], size
+                    )
+                    
+                    if hit:
+                        # Streamed or bulk prices can be seconds old; confirm with a fresh ticker before closing
+                        confirmed_price = self._fetch_ticker_price(symbol)
+                        if not confirmed_price:
+                            self.logger.warning("Could not confirm stop loss hit for %s with a fresh price; retrying next run", symbol)
+                            continue
+                        if confirmed_price != current_price:
+                            current_price = confirmed_price
+                            stored_pos['current_price'] = current_price
+                            dirty[symbol] = stored_pos
+                            hit, new_stop_loss = self._evaluate_stop_loss(
+                                current_price, stored_pos['stop_loss'], stored_pos['entry_price'], size
+                            )
+                    
+                    if hit:
+                        print(f"\nStop loss hit for {symbol} ({position_type} position)")
+                        print(f"Current Price: {current_price}")
+                        print(f"Stop Loss: {stored_pos['stop_loss']}")
+                        
+                        # Close position with an opposite-side market order after the pass
+                        to_close.append((symbol, product_id, size, 'sell' if is_long else 'buy'))
+                    elif new_stop_loss is not None:
+                        # Update trailing stop loss
+                        old_stop_loss = stored_pos['stop_loss']
+                        stored_pos['stop_loss'] = new_stop_loss
+                        stored_pos['stop_loss_updates'] += 1
+                        stored_pos['last_update'] = now_str
+                        dirty[symbol] = stored_pos
+                        
+                        # Log stop loss update
+                        self.logger.info(
+                            "Updated %s stop loss for %s\n"
+                            "  Old Stop Loss: %s\n"
+                            "  New Stop Loss: %s\n"
+                            "  Current Price: %s\n"
+                            "  Update Count: %s",
+                            position_type.lower(), symbol, old_stop_loss,
+                            new_stop_loss, current_price, stored_pos['stop_loss_updates']
+                        )
+                        
+                        print(f"\nUpdated stop loss for {symbol}")
+                        print(f"Position Type: {position_type}")
+                        print(f"Current Price: {current_price}")
+                        print(f"New stop loss: {new_stop_loss}")
+            
+            # Symbols to drop from the stored state, applied once all passes are done
+            to_delete = []
+            
+            # Send all close orders at once and drop positions whose order succeeded
+            futures = {
+                self._order_pool.submit(
+                    self.exchange.place_order,
+                    product_id=product_id,
+                    size=abs(size),
+                    order_type='market_order',
+                    side=side
+                ): (symbol, side)
+                for symbol, product_id, size, side in to_close
+            }
+            for future in as_completed(futures):
+                symbol, side = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    self.logger.error("Error closing position for %s: %s", symbol, e)
+                    continue
+                
+                if response.get('success'):
+                    print(f"Successfully closed {'long' if side == 'sell' else 'short'} position for {symbol}")
+                    to_delete.append(symbol)
+                else:
+                    print(f"Failed to close position for {symbol}: {response}")
+            
+            # Remove closed positions
+            closed_positions = stored_positions.keys() - current_symbols
+            for symbol in closed_positions:
+                position = stored_positions[symbol]
+                self.logger.info(
+                    "Position closed: %s\n"
+                    "  Type: %s\n"
+                    "  Entry Price: %s\n"
+                    "  Final Price: %s\n"
+                    "  Stop Loss: %s\n"
+                    "  Stop Loss Updates: %s\n"
+                    "  Last Update: %s",
+                    symbol, 'Long' if position['size'] > 0 else 'Short', position['entry_price'],
+                    position['current_price'], position['stop_loss'],
+                    position['stop_loss_updates'], position['last_update']
+                )
+                print(f"\nPosition closed: {symbol}")
+                to_delete.append(symbol)
+            
+            for symbol in to_delete:
+                del stored_positions[symbol]
+                dirty[symbol] = None
+            
+            # Log only the positions that changed
+            self._append_wal(dirty, positions_data)
+            
+            # Print summary
+            print("\n=== Current Positions Summary ===")
+            for symbol, pos_data in stored_positions.items():
+                print(f"\nSymbol: {symbol}")
+                print(f"Position Type: {'Long' if pos_data['size'] > 0 else 'Short'}")
+                print(f"Entry Price: {pos_data['entry_price']}")
+                print(f"Current Price: {pos_data['current_price']}")
+                print(f"Stop Loss: {pos_data['stop_loss']}")
+                print(f"Size: {pos_data['size']}")
+                print(f"Stop Loss Updates: {pos_data['stop_loss_updates']}")
+                print(f"Last Update: {pos_data['last_update']}")
+                print("-------------------")
+
+            print("\n=== Stop Loss Check Complete ===")
+            print(f"Checked {len(current_by_symbol)} positions for stop loss hits")
+            print(f"Successfully managed {len(stored_positions)} active positions")
+
+        except Exception as e:
+            self.logger.error("Error in manage_stop_losses: %s", e)
+            print(f"Error occurred: {str(e)}")
+            # Changes from a failed pass may not have been logged; resync with disk
+            self._positions_state = self._load_positions_data()
+
+    def _setup_logger(self):
+        """Setup logging configuration once per process."""
+        logger = logging.getLogger('TrailingStopManager')
+        if logger.handlers:
+            # Already configured by an earlier TrailingStopManager in this process
+            return logger
+        logger.setLevel(logging.INFO)
+        
+        # Create logs directory relative to script directory
+        log_dir = os.path.join(self.script_dir, 'logs')
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+            print(f"Using log directory: {log_dir}")
+        except Exception as e:
+            print(f"Warning: Could not create log directory: {e}")
+            log_dir = self.script_dir  # Fallback to script directory
+        
+        # Create formatters and handlers
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        
+        # File handler
+        file_handler = logging.FileHandler(
+            os.path.join(log_dir, f'trailing_stop_{datetime.now().strftime("%Y%m%d")}.log')
+        )
+        file_handler.setFormatter(formatter)
+        
+        # Console handler
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        
+        # Records are still formatted on the calling thread; only the file and console I/O moves to the listener thread
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(QueueHandler(log_queue))
+        listener = QueueListener(log_queue, file_handler, console_handler)
+        listener.start()
+        atexit.register(listener.stop)  # Flush queued records on exit
+        
+        return logger
+
+def main():
+    parser = argparse.ArgumentParser(description="Trailing stop manager for open Delta Exchange positions")
+    parser.add_argument('--loop', action='store_true',
+                        help="keep running, checking stop losses every --interval seconds")
+    parser.add_argument('--interval', type=float, default=60,
+                        help="seconds between checks in --loop mode (default: 60)")
+    args = parser.parse_args()
+    
+    # Setup basic logging for main function
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    logger = logging.getLogger('main')
+    
+    try:
+        # Load environment variables
+        load_dotenv()
+        
+        api_key = os.getenv('API_KEY')
+        api_secret = os.getenv('API_SECRET')
+        
+        if not api_key or not api_secret:
+            logger.error("API credentials not found in environment variables")
+            return
+        
+        logger.info("Starting TrailingStopManager")
+        manager = TrailingStopManager(api_key, api_secret)
+        
+        def handle_sigterm(signum, frame):
+            logger.info("Received SIGTERM, shutting down")
+            manager.close()
+            sys.exit(0)
+        
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        
+        # Run the manager; in loop mode the price stream stays connected between checks
+        if args.loop:
+            while True:
+                started = time.monotonic()
+                manager.manage_stop_losses()
+                time.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+        else:
+            manager.manage_stop_losses()
+        
+    except KeyboardInterrupt:
+        logger.info("Program interrupted by user")
+    except Exception as e:
+        logger.error("Program terminated due to error: %s", e)
+
+if __name__ == "__main__":
+    main()
@@ -1,223 +1,256 @@
-# This script is used to check the margin requirements for USD perpetual futures.
-# It uses the Delta Exchange API to get the list of products and then gets the margin requirements for each product.
-# Demo Output:
-# Margin Requirements for USD Perpetual Futures:
-# Symbol      Price     Contract Unit    Leverage    Init Margin%    Margin/Lot($)
-# BTCUSD      50000.00   BTC             10x          1.00%          $5000.00
-
-# Simplified Symbol-Margin List:
-# [
-#     {'BTCUSD': '$5000.00'},
-#     {'ETHUSD': '$1000.00'},
-#     {'SOLUSD': '$500.00'}
-# ]
-
-
-import hashlib
-import hmac
-import json
-import time
-import requests
-import logging
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-api_key = os.getenv('API_KEY')
-api_secret = os.getenv('API_SECRET')
-
-class DeltaMarginChecker:
-    def __init__(self, api_key: str, api_secret: str, base_url: str = 'https://api.india.delta.exchange/v2'):
-        self.api_key = api_key
-        self.api_secret = api_secret
-        self.base_url = base_url
-        self.logger = self._setup_logger()
-
-    def _setup_logger(self) -> logging.Logger:
-        """Setup logging configuration."""
-        logger = logging.getLogger(__name__)
-        if not logger.handlers:
-            logger.setLevel(logging.INFO)
-            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-            
-            # Create logs directory if it doesn't exist
-            log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs')
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-            
-            # File handler with path to logs directory
-            file_handler = logging.FileHandler(
-                os.path.join(log_dir, f'delta_margin_check_{datetime.now().strftime("%Y%m%d")}.log')
-            )
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
-            
-            # Console handler
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
-        return logger
-
-    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> Tuple[str, str]:
-        """Generate signature for API authentication."""
-        try:
-            timestamp = str(int(time.time()) + 3)
-            signature_data = method + timestamp + endpoint + payload
-            message = bytes(signature_data, 'utf-8')
-            secret = bytes(self.api_secret, 'utf-8')
-            hash_obj = hmac.new(secret, message, hashlib.sha256)
-            return hash_obj.hexdigest(), timestamp
-        except Exception as e:
-            self.logger.error(f"Error generating signature: {str(e)}")
-            raise
-
-    def get_margin_requirements(self) -> Optional[List[Dict]]:
-        """Fetch and display margin requirements for USD perpetual futures."""
-        try:
-            self.logger.info("Fetching current prices...")
-            # First get current prices from public API
-            try:
-                public_response = requests.get(f'{self.base_url}/tickers', timeout=10)
-                public_response.raise_for_status()
-                public_data = public_response.json()
-            except requests.exceptions.RequestException as e:
-                self.logger.error(f"Failed to fetch prices: {str(e)}")
-                return None
-            
-            if not public_data.get('success'):
-                self.logger.error(f"Error in price API response: {public_data.get('error', 'Unknown error')}")
-                return None
-                
-            # Create a price dictionary for quick lookup
-            prices = {}
-            for ticker in public_data['result']:
-                try:
-                    symbol = ticker.get('symbol')
-                    mark_price = ticker.get('mark_price')
-                    if symbol and mark_price:
-                        prices[symbol] = float(mark_price)
-                except (ValueError, TypeError) as e:
-                    self.logger.warning(f"Invalid price data for {symbol}: {str(e)}")
-                    continue
-                
-            self.logger.info("Fetching product details...")
-            # Then get product details
-            try:
-                method = 'GET'
-                endpoint = '/v2/products'
-                signature, timestamp = self._generate_signature(method, endpoint)
-                
-                headers = {
-                    'api-key': self.api_key,
-                    'signature': signature,
-                    'timestamp': timestamp,
-                    'Content-Type': 'application/json'
-                }
-                
-                response = requests.get(f'{self.base_url}/products', headers=headers, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-            except requests.exceptions.RequestException as e:
-                self.logger.error(f"Failed to fetch product details: {str(e)}")
-                return None
-            
-            if not data.get('success'):
-                self.logger.error(f"Error in product API response: {data.get('error', 'Unknown error')}")
-                return None
-                
-            # Store results for sorting
-            results = []
-            
-            # Process all products
-            for product in data['result']:
-                try:
-                    symbol = product.get('symbol')
-                    contract_type = product.get('contract_type')
-                    
-                    if not all([symbol, contract_type]):
-                        continue
-                    
-                    # Only process USD-denominated perpetual futures
-                    if (symbol and symbol in prices and 
-                        contract_type == 'perpetual_futures' and 
-                        symbol.endswith('USD')):
-                        
-                        current_price = prices[symbol]
-                        contract_value = float(product.get('contract_value', 0))
-                        leverage = float(product.get('default_leverage', 0))
-                        initial_margin = float(product.get('initial_margin', 0)) / 100
-                        contract_unit = product.get('contract_unit_currency', '')
-                        
-                        if contract_value <= 0 or leverage <= 0 or initial_margin <= 0:
-                            self.logger.warning(f"Invalid values for {symbol}: contract_value={contract_value}, leverage={leverage}, initial_margin={initial_margin}")
-                            continue
-                        
-                        # Value of 1 lot = (current_price * contract_value) * initial_margin
-                        one_lot_value = (current_price * contract_value) * initial_margin
-                        
-                        # Store the result
-                        results.append({
-                            'symbol': symbol,
-                            'margin': one_lot_value,
-                            'price': current_price,
-                            'contract_value': contract_value,
-                            'contract_unit': contract_unit,
-                            'leverage': leverage,
-                            'initial_margin': initial_margin * 100
-                        })
-                except (ValueError, TypeError) as e:
-                    self.logger.warning(f"Error processing product {symbol}: {str(e)}")
-                    continue
-            
-            if not results:
-                self.logger.warning("No valid USD perpetual futures found")
-                return None
-                
-            # Sort results by margin required
-            results.sort(key=lambda x: x['margin'])
-            
-            # Print results in a table format
-            print("\nMargin Requirements for USD Perpetual Futures:")
-            print("Symbol".ljust(12) + "Price".rjust(15) + "Contract".rjust(12) + "Unit".rjust(8) + 
-                  "Leverage".rjust(10) + "Init Margin%".rjust(12) + "Margin/Lot($)".rjust(15))
-            print("-" * 84)
-            
-            for result in results:
-                print(
-                    f"{result['symbol']:<12}"
-                    f"${result['price']:>14.2f}"
-                    f"{result['contract_value']:>12.3f}"
-                    f"{result['contract_unit']:>8}"
-                    f"{result['leverage']:>10.0f}x"
-                    f"{result['initial_margin']:>12.1f}%"
-                    f"${result['margin']:>14.2f}"
-                )
-            
-            # Print simplified symbol-margin list in the requested format
-            print("\nSimplified Symbol-Margin List:")
-            print("-" * 40)
-            simplified_list = [{result['symbol']: f"${result['margin']:.2f}"} for result in results]
-            # print(json.dumps(simplified_list, indent=2))
-            
-            return simplified_list
-            
-        except Exception as e:
-            self.logger.error(f"Unexpected error in get_margin_requirements: {str(e)}")
-            return None
-
-def main():
-    
-    checker = DeltaMarginChecker(api_key, api_secret)
-    try:
-        simplified_list = checker.get_margin_requirements()
-        print(simplified_list)
-    except KeyboardInterrupt:
-        checker.logger.info("Program interrupted by user")
-    except Exception as e:
-        checker.logger.error(f"Program terminated due to error: {str(e)}")
-
-if __name__ == "__main__":
+# This script is used to check the margin requirements for USD perpetual futures.
+# It uses the Delta Exchange API to get the list of products and then gets the margin requirements for each product.
+# Demo Output:
+# Margin Requirements for USD Perpetual Futures:
+# Symbol      Price     Contract Unit    Leverage    Init Margin%    Margin/Lot($)
+# BTCUSD      50000.00   BTC             10x          1.00%          $5000.00
+
+# Simplified Symbol-Margin List:
+# [
+#     {'BTCUSD': '$5000.00'},
+#     {'ETHUSD': '$1000.00'},
+#     {'SOLUSD': '$500.00'}
+# ]
+
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+import logging
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import os
+import sys
+from dotenv import load_dotenv
+from src.utils.file_cache import FileCache, host_key
+from src.utils.rate_limiter import host_bucket
+from src.utils.server_clock import signing_timestamp
+from src.utils.signing import HmacSha256
+
+load_dotenv()
+
+api_key = os.getenv('API_KEY')
+api_secret = os.getenv('API_SECRET')
+
+# The product list changes rarely (new listings), so it is cached on disk
+PRODUCTS_TTL = 6 * 60 * 60
+
+class DeltaMarginChecker:
+    def __init__(self, api_key: str, api_secret: str, base_url: str = 'https://api.india.delta.exchange/v2',
+                 cache_dir: str = 'cache'):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self._signer = HmacSha256((api_secret or '').encode('utf-8'))  # Keyed once, reused for every signature
+        self.base_url = base_url
+        self.logger = self._setup_logger()
+        self.session = self._setup_requests_session()  # Tickers and products share one connection
+        self.cache = FileCache(cache_dir)
+        # Product lists differ between hosts (e.g. testnet and production), so the key names the host
+        self._products_key = host_key('products', self.base_url)
+        self.rate_limiter = host_bucket(self.base_url)  # Shared with the other clients for this host
+
+    def _setup_logger(self) -> logging.Logger:
+        """Setup logging configuration."""
+        logger = logging.getLogger(__name__)
+        if not logger.handlers:
+            logger.setLevel(logging.INFO)
+            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+            
+            # Create logs directory if it doesn't exist
+            log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'logs')
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+            
+            # File handler with path to logs directory, capped at 5 x 10 MB
+            file_handler = RotatingFileHandler(
+                os.path.join(log_dir, f'delta_margin_check_{datetime.now().strftime("%Y%m%d")}.log'),
+                maxBytes=10_000_000,
+                backupCount=5
+            )
+            file_handler.setFormatter(formatter)
+            logger.addHandler(file_handler)
+            
+            # Console handler
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            logger.addHandler(console_handler)
+        return logger
+
+    def _setup_requests_session(self) -> requests.Session:
+        """Setup requests session with retries."""
+        session = requests.Session()
+        
+        # Retry transient failures with exponential backoff (0.1, 0.2, 0.4 seconds)
+        retries = Retry(
+            total=3,
+            backoff_factor=0.1,
+            status_forcelist=[408, 429, 500, 502, 503, 504],
+        )
+        
+        # Add retry adapter to session
+        adapter = HTTPAdapter(max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        
+        return session
+
+    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> Tuple[str, str]:
+        """Generate signature for API authentication."""
+        timestamp = signing_timestamp(self.base_url)
+        message = f'{method}{timestamp}{endpoint}{payload}'.encode('utf-8')
+        return self._signer.hexdigest(message), timestamp
+
+    def get_margin_requirements(self, refresh_products: bool = False) -> Optional[List[Dict]]:
+        """Fetch and display margin requirements for USD perpetual futures.
+
+        With `refresh_products`, the cached product list is ignored and fetched again.
+        """
+        try:
+            self.logger.info("Fetching current prices...")
+            # First get current prices from public API
+            try:
+                self.rate_limiter.acquire()
+                public_response = self.session.get(f'{self.base_url}/tickers', timeout=10)
+                public_response.raise_for_status()
+                public_data = orjson.loads(public_response.content)
+            except requests.exceptions.RequestException as e:
+                self.logger.error(f"Failed to fetch prices: {str(e)}")
+                return None
+            
+            if not public_data.get('success'):
+                self.logger.error(f"Error in price API response: {public_data.get('error', 'Unknown error')}")
+                return None
+                
+            # Raw mark prices by symbol; only the ones matched to a product are converted below
+            prices = {
+                ticker['symbol']: ticker['mark_price']
+                for ticker in public_data['result']
+                if ticker.get('symbol') and ticker.get('mark_price')
+            }
+                
+            self.logger.info("Fetching product details...")
+            # Then get product details, from the disk cache when it is fresh enough
+            products = None if refresh_products else self.cache.get(self._products_key, PRODUCTS_TTL)
+            if products is None:
+                try:
+                    method = 'GET'
+                    endpoint = '/v2/products'
+                    self.rate_limiter.acquire()
+                    signature, timestamp = self._generate_signature(method, endpoint)
+                    
+                    headers = {
+                        'api-key': self.api_key,
+                        'signature': signature,
+                        'timestamp': timestamp,
+                        'Content-Type': 'application/json'
+                    }
+                    
+                    response = self.session.get(f'{self.base_url}/products', headers=headers, timeout=10)
+                    response.raise_for_status()
+                    data = orjson.loads(response.content)
+                except requests.exceptions.RequestException as e:
+                    self.logger.error(f"Failed to fetch product details: {str(e)}")
+                    return None
+                
+                if not data.get('success'):
+                    self.logger.error(f"Error in product API response: {data.get('error', 'Unknown error')}")
+                    return None
+                
+                products = data['result']
+                try:
+                    self.cache.set(self._products_key, products)
+                except OSError as e:
+                    self.logger.warning(f"Could not cache products: {e}")
+                
+            # Store results for sorting
+            results = []
+            
+            # Process all products
+            for product in products:
+                symbol = product.get('symbol')
+                try:
+                    # Only process USD-denominated perpetual futures that have a price
+                    if (product.get('contract_type') == 'perpetual_futures' and
+                        symbol and symbol.endswith('USD') and
+                        symbol in prices):
+                        
+                        current_price = float(prices[symbol])
+                        contract_value = float(product.get('contract_value', 0))
+                        leverage = float(product.get('default_leverage', 0))
+                        initial_margin = float(product.get('initial_margin', 0)) / 100
+                        contract_unit = product.get('contract_unit_currency', '')
+                        
+                        if contract_value <= 0 or leverage <= 0 or initial_margin <= 0:
+                            self.logger.warning(f"Invalid values for {symbol}: contract_value={contract_value}, leverage={leverage}, initial_margin={initial_margin}")
+                            continue
+                        
+                        # Value of 1 lot = (current_price * contract_value) * initial_margin
+                        one_lot_value = (current_price * contract_value) * initial_margin
+                        
+                        # Store the result
+                        results.append({
+                            'symbol': symbol,
+                            'margin': one_lot_value,
+                            'price': current_price,
+                            'contract_value': contract_value,
+                            'contract_unit': contract_unit,
+                            'leverage': leverage,
+                            'initial_margin': initial_margin * 100
+                        })
+                except (ValueError, TypeError) as e:
+                    self.logger.warning(f"Error processing product {symbol}: {str(e)}")
+                    continue
+            
+            if not results:
+                self.logger.warning("No valid USD perpetual futures found")
+                return None
+                
+            # Sort results by margin required
+            results.sort(key=lambda x: x['margin'])
+            
+            # Build the whole table and write it once instead of one print per row
+            lines = [
+                "\nMargin Requirements for USD Perpetual Futures:",
+                "Symbol".ljust(12) + "Price".rjust(15) + "Contract".rjust(12) + "Unit".rjust(8) +
+                "Leverage".rjust(10) + "Init Margin%".rjust(12) + "Margin/Lot($)".rjust(15),
+                "-" * 84,
+            ]
+            lines.extend(
+                f"{result['symbol']:<12}"
+                f"${result['price']:>14.2f}"
+                f"{result['contract_value']:>12.3f}"
+                f"{result['contract_unit']:>8}"
+                f"{result['leverage']:>10.0f}x"
+                f"{result['initial_margin']:>12.1f}%"
+                f"${result['margin']:>14.2f}"
+                for result in results
+            )
+            
+            # Simplified symbol-margin list in the requested format
+            lines.append("\nSimplified Symbol-Margin List:")
+            lines.append("-" * 40)
+            sys.stdout.write('\n'.join(lines) + '\n')
+            simplified_list = [{result['symbol']: f"${result['margin']:.2f}"} for result in results]
+            # print(orjson.dumps(simplified_list, option=orjson.OPT_INDENT_2).decode())
+            
+            return simplified_list
+            
+        except Exception as e:
+            self.logger.error(f"Unexpected error in get_margin_requirements: {str(e)}")
+            return None
+
+def main():
+    
+    checker = DeltaMarginChecker(api_key, api_secret)
+    try:
+        simplified_list = checker.get_margin_requirements()
+        print(simplified_list)
+    except KeyboardInterrupt:
+        checker.logger.info("Program interrupted by user")
+    except Exception as e:
+        checker.logger.error(f"Program terminated due to error: {str(e)}")
+
+if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,161 +1,198 @@
-# This script is used to fetch all open positions for USD products from Delta Exchange.
-# It uses the Delta Exchange API to get the open positions.
-# It then prints the open positions to the console.
-
-
-import hashlib
-import hmac
-import time
-import requests
-import logging
-from typing import Dict, List, Optional
-from datetime import datetime
-import os
-from dotenv import load_dotenv
-import sys
-
-load_dotenv()
-
-api_key = os.getenv('API_KEY')
-api_secret = os.getenv('API_SECRET')
-
-class OpenPositionsFetcher:
-    def __init__(self, api_key: str, api_secret: str):
-        self.api_key = api_key
-        self.api_secret = api_secret
-        self.base_url = 'https://api.india.delta.exchange'
-        self.logger = logging.getLogger('OpenPositionsFetcher')
-
-    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> tuple[str, str]:
-        """Generate signature for API authentication."""
-        try:
-            timestamp = str(int(time.time())+3)
-            signature_data = method + timestamp + endpoint + payload
-            message = bytes(signature_data, 'utf-8')
-            secret = bytes(self.api_secret, 'utf-8')
-            hash = hmac.new(secret, message, hashlib.sha256)
-            return hash.hexdigest(), timestamp
-        except Exception as e:
-            self.logger.error(f"Error generating signature: {str(e)}")
-            raise
-
-    def _get_all_usd_products(self) -> List[Dict]:
-        """Get all USD products from Delta Exchange."""
-        try:
-            print("Fetching products", end='', flush=True)
-            method = 'GET'
-            endpoint = '/v2/products'
-            signature, timestamp = self._generate_signature(method, endpoint)
-            
-            headers = {
-                'api-key': self.api_key,
-                'signature': signature,
-                'timestamp': timestamp,
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.get(f'{self.base_url}/v2/products', headers=headers)
-            data = response.json()
-            
-            if not data.get('success'):
-                print(" [X]")
-                self.logger.error("Failed to fetch products")
-                return []
-                
-            products = [{'id': product.get('id'), 'symbol': product.get('symbol')} 
-                       for product in data['result'] 
-                       if isinstance(product, dict) and product.get('symbol', '').endswith('USD')]
-            print(" [OK]")
-            return products
-        except Exception as e:
-            print(" [X]")
-            self.logger.error(f"Error fetching products: {str(e)}")
-            return []
-
-    def get_open_positions(self) -> List[Dict]:
-        """Get all open positions for USD products."""
-        try:
-            products_list = self._get_all_usd_products()
-            if not products_list:
-                self.logger.error("No products found to check positions")
-                return []
-
-            all_positions = []
-            method = 'GET'
-            total_products = len(products_list)
-            
-            print(f"Checking positions for {total_products} products", end='', flush=True)
-            
-            for i, product in enumerate(products_list, 1):
-                try:
-                    # Generate new signature for each position request
-                    product_id = product['id']
-                    endpoint = f'/v2/positions?product_id={product_id}'
-                    signature, timestamp = self._generate_signature(method, endpoint)
-                    headers = {
-                        'api-key': self.api_key,
-                        'signature': signature,
-                        'timestamp': timestamp,
-                        'Content-Type': 'application/json'
-                    }
-                    
-                    response = requests.get(f'{self.base_url}/v2/positions?product_id={product_id}', headers=headers)
-                    position_data = response.json()
-                    # print("Position Data for", product_id, 'is', position_data)
-                    
-                    if position_data.get('success') and position_data.get('result'):
-                        position = position_data['result']
-                        # print("Full Position Data", position)
-                        # Only add positions with non-zero size
-                        if position.get('size', 0) != 0:
-                            all_positions.append({
-                                'product_symbol': product['symbol'],
-                                'position': position
-                            })
-                    
-                    # Print progress dots
-                    if i % 5 == 0 or i == total_products:
-                        print(".", end='', flush=True)
-                        
-                    # Add a small delay to avoid rate limiting
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    self.logger.error(f"Error fetching position for {product['symbol']}: {str(e)}")
-                    continue
-
-            print(" [OK]")
-
-            # Print only the non-zero positions that exist
-            if all_positions:
-                print("\nActive Open Positions:")
-                for position in all_positions:
-                    print(f"Symbol: {position['product_symbol']}")
-                    print(f"Size: {position['position'].get('size', 0)}")
-                    print(f"Entry Price: {position['position'].get('entry_price', 'N/A')}")
-                    print("-------------------")
-            else:
-                print("\nNo active open positions found")
-
-            return all_positions
-
-        except Exception as e:
-            print(" [X]")
-            self.logger.error(f"Error in get_open_positions: {str(e)}")
-            return []
-
-def main():
-    fetcher = OpenPositionsFetcher(api_key, api_secret)
-    try:
-        positions = fetcher.get_open_positions()
-        if not positions:
-            print("No open positions found")
-    except KeyboardInterrupt:
-        print("\nProgram interrupted by user")
-        fetcher.logger.info("Program interrupted by user")
-    except Exception as e:
-        print("\nProgram terminated due to error")
-        fetcher.logger.error(f"Program terminated due to error: {str(e)}")
-
-if __name__ == "__main__":
+# This script is used to fetch all open positions for USD products from Delta Exchange.
+# It uses the Delta Exchange API to get the open positions.
+# It then prints the open positions to the console.
+
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+import logging
+from typing import Dict, List, Optional
+from datetime import datetime
+import os
+from dotenv import load_dotenv
+import sys
+from src.utils.file_cache import FileCache, host_key
+from src.utils.rate_limiter import host_bucket
+from src.utils.server_clock import signing_timestamp
+from src.utils.signing import HmacSha256
+
+load_dotenv()
+
+api_key = os.getenv('API_KEY')
+api_secret = os.getenv('API_SECRET')
+
+# The product list changes rarely (new listings), so it is cached on disk
+PRODUCTS_TTL = 6 * 60 * 60
+
+class OpenPositionsFetcher:
+    def __init__(self, api_key: str, api_secret: str, cache_dir: str = 'cache'):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self._signer = HmacSha256((api_secret or '').encode('utf-8'))  # Keyed once, reused for every signature
+        self.base_url = 'https://api.india.delta.exchange'
+        self.logger = logging.getLogger('OpenPositionsFetcher')
+        self.session = self._setup_requests_session()  # Products and positions requests share one keep-alive connection
+        self.cache = FileCache(cache_dir)
+        # Product lists differ between hosts (e.g. testnet and production), so the key names the host
+        self._products_key = host_key('products', self.base_url)
+        self.rate_limiter = host_bucket(self.base_url)
+        # Progress markers are noise in redirected output (cron, CloudWatch)
+        self.show_progress = sys.stdout.isatty()
+
+    def _setup_requests_session(self) -> requests.Session:
+        """Setup requests session with retries."""
+        session = requests.Session()
+        
+        # Retry transient failures with exponential backoff (0.1, 0.2, 0.4 seconds)
+        retries = Retry(
+            total=3,
+            backoff_factor=0.1,
+            status_forcelist=[408, 429, 500, 502, 503, 504],
+        )
+        
+        # Add retry adapter to session
+        adapter = HTTPAdapter(max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        
+        return session
+
+    def _progress(self, text: str, end: str = ''):
+        """Write a progress marker, but only to an interactive terminal."""
+        if self.show_progress:
+            print(text, end=end, flush=True)
+
+    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> tuple[str, str]:
+        """Generate signature for API authentication."""
+        timestamp = signing_timestamp(self.base_url)
+        message = f'{method}{timestamp}{endpoint}{payload}'.encode('utf-8')
+        return self._signer.hexdigest(message), timestamp
+
+    def _get_all_usd_products(self, refresh: bool = False) -> List[Dict]:
+        """Get all USD products from Delta Exchange; `refresh` bypasses the disk cache."""
+        try:
+            self._progress("Fetching products")
+            all_products = None if refresh else self.cache.get(self._products_key, PRODUCTS_TTL)
+            if all_products is None:
+                self.rate_limiter.acquire()
+                method = 'GET'
+                endpoint = '/v2/products'
+                signature, timestamp = self._generate_signature(method, endpoint)
+                
+                headers = {
+                    'api-key': self.api_key,
+                    'signature': signature,
+                    'timestamp': timestamp,
+                    'Content-Type': 'application/json'
+                }
+                
+                response = self.session.get(f'{self.base_url}/v2/products', headers=headers, timeout=10)
+                data = orjson.loads(response.content)
+                
+                if not data.get('success'):
+                    self._progress(" [X]", end='\n')
+                    self.logger.error("Failed to fetch products")
+                    return []
+                
+                all_products = data['result']
+                try:
+                    self.cache.set(self._products_key, all_products)
+                except OSError as e:
+                    self.logger.warning(f"Could not cache products: {e}")
+                
+            products = [{'id': product.get('id'), 'symbol': product.get('symbol')} 
+                       for product in all_products 
+                       if isinstance(product, dict) and product.get('symbol', '').endswith('USD')]
+            self._progress(" [OK]", end='\n')
+            return products
+        except Exception as e:
+            self._progress(" [X]", end='\n')
+            self.logger.error(f"Error fetching products: {str(e)}")
+            return []
+
+    def get_open_positions(self, refresh_products: bool = False) -> Optional[List[Dict]]:
+        """Get all open positions for USD products; `refresh_products` bypasses the product cache.
+
+        Returns None when the positions could not be fetched, so callers can tell a
+        failed request apart from an account with no open positions.
+        """
+        try:
+            products_list = self._get_all_usd_products(refresh=refresh_products)
+            if not products_list:
+                self.logger.error("No products found to check positions")
+                return None
+
+            # Only USD products are managed; map their IDs back to symbols
+            symbols_by_id = {product['id']: product['symbol'] for product in products_list}
+            
+            self._progress("Checking open positions")
+            
+            # One call returns every open position instead of one request per product
+            self.rate_limiter.acquire()
+            method = 'GET'
+            endpoint = '/v2/positions/margined'
+            signature, timestamp = self._generate_signature(method, endpoint)
+            headers = {
+                'api-key': self.api_key,
+                'signature': signature,
+                'timestamp': timestamp,
+                'Content-Type': 'application/json'
+            }
+            
+            response = self.session.get(f'{self.base_url}{endpoint}', headers=headers, timeout=10)
+            position_data = orjson.loads(response.content)
+            
+            if not position_data.get('success'):
+                self._progress(" [X]", end='\n')
+                self.logger.error(f"Failed to fetch positions: {position_data.get('error')}")
+                return None
+            
+            # Only add USD positions with non-zero size
+            all_positions = [
+                {
+                    'product_symbol': symbols_by_id[position['product_id']],
+                    'position': position
+                }
+                for position in position_data.get('result') or []
+                if position.get('product_id') in symbols_by_id and float(position.get('size') or 0) != 0
+            ]
+
+            self._progress(" [OK]", end='\n')
+
+            # Print only the non-zero positions that exist
+            if all_positions:
+                print("\nActive Open Positions:")
+                for position in all_positions:
+                    print(f"Symbol: {position['product_symbol']}")
+                    print(f"Size: {position['position'].get('size', 0)}")
+                    print(f"Entry Price: {position['position'].get('entry_price', 'N/A')}")
+                    print("-------------------")
+            else:
+                print("\nNo active open positions found")
+
+            return all_positions
+
+        except Exception as e:
+            self._progress(" [X]", end='\n')
+            self.logger.error(f"Error in get_open_positions: {str(e)}")
+            return None
+
+def main():
+    fetcher = OpenPositionsFetcher(api_key, api_secret)
+    try:
+        positions = fetcher.get_open_positions()
+        if positions is None:
+            print("Could not fetch open positions")
+        elif not positions:
+            print("No open positions found")
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user")
+        fetcher.logger.info("Program interrupted by user")
+    except Exception as e:
+        print("\nProgram terminated due to error")
+        fetcher.logger.error(f"Program terminated due to error: {str(e)}")
+
+if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1 +1 @@
-  
+  
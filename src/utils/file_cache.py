@@ -0,0 +1,52 @@
+# File-backed JSON cache for reference data that rarely changes (product lists,
+# symbol -> product ID mappings). Each key is stored as its own JSON file and
+# its modification time is used for TTL checks.
+
+import os
+import threading
+import time
+from typing import Any, Optional
+from urllib.parse import urlsplit
+import orjson
+
+
+def host_key(name: str, url: str) -> str:
+    """Cache key for data that belongs to one API host, e.g. host_key('products', base_url)."""
+    return f"{name}_{urlsplit(url).netloc.replace(':', '_')}"
+
+
+class FileCache:
+    """JSON file cache keyed by name, with TTL checks and atomic writes."""
+
+    def __init__(self, cache_dir: str = 'cache'):
+        self.cache_dir = cache_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def get(self, key: str, ttl: float) -> Optional[Any]:
+        """Return cached data for key if it is younger than ttl seconds, otherwise None."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                return None
+            with open(path, 'rb') as f:
+                return orjson.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, data: Any):
+        """Store data for key, writing to a temp file and renaming it into place."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(orjson.dumps(data))
+        os.replace(temp_path, path)
+
+    def invalidate(self, key: str):
+        """Drop the cached entry for key, if any."""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,51 @@
+# Token bucket rate limiter shared by the Delta Exchange clients.
+# Requests only block once the burst allowance is used up, instead of
+# sleeping a fixed amount between every call. The exchange limits the
+# account per host, so every client in a process draws from the same
+# bucket for that host (see host_bucket).
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# Buckets keyed by origin (scheme://host), shared by every client in the process
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def host_bucket(base_url: str) -> TokenBucket:
+    """Return the process-wide bucket for the host of base_url, allowing DELTA_RPS requests per second."""
+    parts = urlsplit(base_url)
+    origin = f'{parts.scheme}://{parts.netloc}'
+    with _buckets_lock:
+        bucket = _buckets.get(origin)
+        if bucket is None:
+            bucket = _buckets[origin] = TokenBucket(float(os.getenv('DELTA_RPS', 10)))
+        return bucket
@@ -0,0 +1,62 @@
+# Offset between the local clock and the exchange's clock, used to build
+# signed request timestamps. It is measured per host from the HTTP Date
+# header instead of padding every timestamp with a fixed skew, and measured
+# again periodically so long-running processes follow clock drift.
+
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# A good measurement is reused this long; a failed one is retried sooner
+OFFSET_TTL = 60 * 60
+RETRY_AFTER = 60
+
+# Offsets keyed by origin (scheme://host): (offset, monotonic time it should be measured again)
+_offsets: Dict[str, Tuple[int, float]] = {}
+
+
+def _measure_offset(origin: str) -> Optional[int]:
+    """Seconds to add to local time to match the server clock, or None if it cannot be measured."""
+    try:
+        sent = time.time()
+        response = requests.head(origin, timeout=5)
+        received = time.time()
+        # The Date header is truncated to whole seconds, so the server's clock was on average
+        # half a second past it; without the +0.5 the offset comes out 0.5s low
+        server_time = parsedate_to_datetime(response.headers['Date']).timestamp() + 0.5
+        # Compare against the midpoint of the round-trip
+        return round(server_time - (sent + received) / 2)
+    except Exception as e:
+        logger.warning("Could not measure clock offset for %s: %s", origin, e)
+        return None
+
+
+def clock_offset(base_url: str) -> int:
+    """Return the clock offset for the host of base_url, measuring it when missing or due."""
+    parts = urlsplit(base_url)
+    origin = f'{parts.scheme}://{parts.netloc}'
+    now = time.monotonic()
+    cached = _offsets.get(origin)
+    if cached is not None and now < cached[1]:
+        return cached[0]
+    
+    # Measured without holding any lock; concurrent callers may both measure, last write wins
+    offset = _measure_offset(origin)
+    if offset is None:
+        # Keep the last good offset (local time if there is none) and try again after RETRY_AFTER
+        offset = cached[0] if cached is not None else 0
+        _offsets[origin] = (offset, now + RETRY_AFTER)
+    else:
+        _offsets[origin] = (offset, now + OFFSET_TTL)
+    return offset
+
+
+def signing_timestamp(base_url: str) -> str:
+    """Current Unix time in whole seconds aligned to base_url's server, as sent in the `timestamp` header."""
+    return str(int(time.time()) + clock_offset(base_url))
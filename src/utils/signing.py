@@ -0,0 +1,28 @@
+# HMAC-SHA256 request signing shared by the Delta Exchange clients.
+# The key is fixed for the life of a client, so the padded inner and outer
+# hash states are prepared once and each signature only copies them.
+
+import hashlib
+
+_BLOCK_SIZE = 64  # SHA-256 block size in bytes
+_TRANS_36 = bytes(x ^ 0x36 for x in range(256))
+_TRANS_5C = bytes(x ^ 0x5C for x in range(256))
+
+
+class HmacSha256:
+    """HMAC-SHA256 with a fixed key, producing the hex signatures the exchange expects."""
+
+    def __init__(self, key: bytes):
+        if len(key) > _BLOCK_SIZE:
+            key = hashlib.sha256(key).digest()
+        key = key.ljust(_BLOCK_SIZE, b'\0')
+        self._inner = hashlib.sha256(key.translate(_TRANS_36))
+        self._outer = hashlib.sha256(key.translate(_TRANS_5C))
+
+    def hexdigest(self, message: bytes) -> str:
+        """Return the hex HMAC of `message`."""
+        inner = self._inner.copy()
+        inner.update(message)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.hexdigest()
@@ -1,65 +1,91 @@
-# This script is used to check the wallet balance of the user.
-# It uses the Delta Exchange API to get the wallet balance.
-# Demo Output:
-# Wallet Balance (USD): $126.00
-
-
-import hashlib
-import hmac
-import json
-import time
-import requests
-import logging
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-class DeltaWallet:
-    def __init__(self):
-        self.api_key = os.getenv('API_KEY')
-        self.api_secret = os.getenv('API_SECRET')
-        self.base_url = 'https://api.india.delta.exchange'
-
-    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> Tuple[str, str]:
-        timestamp = str(int(time.time()) + 3)
-        signature_data = method + timestamp + endpoint + str(payload)
-        message = bytes(signature_data, 'utf-8')
-        secret = bytes(self.api_secret, 'utf-8')
-        hash_obj = hmac.new(secret, message, hashlib.sha256)
-        return hash_obj.hexdigest(), timestamp
-
-    def get_wallet_balance(self) -> Dict:
-        method = 'GET'
-        endpoint = '/v2/wallet/balances'
-        signature, timestamp = self._generate_signature(method, endpoint)
-
-        headers = {
-            'api-key': self.api_key,
-            'signature': signature,
-            'timestamp': timestamp,
-            'Content-Type': 'application/json'
-        }
-
-        response = requests.get(f'{self.base_url}{endpoint}', headers=headers)
-        return response.json()
-
-    def get_usd_available_balance(self) -> float:
-        wallet_data = self.get_wallet_balance()
-        if wallet_data.get('result') and len(wallet_data['result']) > 0:
-            return float(wallet_data['result'][0]['available_balance'])
-        return 0.0
-
-    def get_usd_balance(self) -> float:
-        wallet_data = self.get_wallet_balance()
-        if wallet_data.get('result') and len(wallet_data['result']) > 0:
-            return float(wallet_data['result'][0]['balance'])
-        return 0.0
-
-# Example usage
-if __name__ == "__main__":
-    wallet = DeltaWallet()
-    usd_balance = wallet.get_usd_available_balance()
-    print(f'Wallet Balance (USD): ${usd_balance:,.2f}')
+# This script is used to check the wallet balance of the user.
+# It uses the Delta Exchange API to get the wallet balance.
+# Demo Output:
+# Wallet Balance (USD): $126.00
+
+
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+import logging
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import os
+from dotenv import load_dotenv
+from src.utils.rate_limiter import host_bucket
+from src.utils.server_clock import signing_timestamp
+from src.utils.signing import HmacSha256
+
+load_dotenv()
+
+class DeltaWallet:
+    def __init__(self):
+        self.api_key = os.getenv('API_KEY')
+        self.api_secret = os.getenv('API_SECRET')
+        self._signer = HmacSha256((self.api_secret or '').encode('utf-8'))  # Keyed once, reused for every signature
+        self.base_url = 'https://api.india.delta.exchange'
+        self.session = self._setup_requests_session()  # Keep-alive connection reused across balance polls
+        self.rate_limiter = host_bucket(self.base_url)  # Shared with the other clients for this host
+
+    def _setup_requests_session(self) -> requests.Session:
+        """Setup requests session with retries."""
+        session = requests.Session()
+        
+        # Retry transient failures with exponential backoff (0.1, 0.2, 0.4 seconds)
+        retries = Retry(
+            total=3,
+            backoff_factor=0.1,
+            status_forcelist=[408, 429, 500, 502, 503, 504],
+        )
+        
+        # Add retry adapter to session
+        adapter = HTTPAdapter(max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'api-key': self.api_key, 'Content-Type': 'application/json'})
+        
+        return session
+
+    def _generate_signature(self, method: str, endpoint: str, payload: str = '') -> Tuple[str, str]:
+        timestamp = signing_timestamp(self.base_url)
+        message = f'{method}{timestamp}{endpoint}{payload}'.encode('utf-8')
+        return self._signer.hexdigest(message), timestamp
+
+    def get_wallet_balance(self) -> Dict:
+        method = 'GET'
+        endpoint = '/v2/wallet/balances'
+        self.rate_limiter.acquire()
+        signature, timestamp = self._generate_signature(method, endpoint)
+
+        # api-key and Content-Type are session defaults; only the per-request auth fields are sent here
+        headers = {'signature': signature, 'timestamp': timestamp}
+
+        response = self.session.get(f'{self.base_url}{endpoint}', headers=headers, timeout=10)
+        return orjson.loads(response.content)
+
+    def get_usd_available_balance(self) -> float:
+        wallet_data = self.get_wallet_balance()
+        if wallet_data.get('result') and len(wallet_data['result']) > 0:
+            return float(wallet_data['result'][0]['available_balance'])
+        return 0.0
+
+    def get_usd_balance(self) -> float:
+        wallet_data = self.get_wallet_balance()
+        if wallet_data.get('result') and len(wallet_data['result']) > 0:
+            return float(wallet_data['result'][0]['balance'])
+        return 0.0
+
+    def get_usd_balances(self) -> Tuple[float, float]:
+        """Return (total, available) USD balance from a single wallet request."""
+        wallet_data = self.get_wallet_balance()
+        if wallet_data.get('result') and len(wallet_data['result']) > 0:
+            usd = wallet_data['result'][0]
+            return float(usd['balance']), float(usd['available_balance'])
+        return 0.0, 0.0
+
+# Example usage
+if __name__ == "__main__":
+    wallet = DeltaWallet()
+    usd_balance = wallet.get_usd_available_balance()
+    print(f'Wallet Balance (USD): ${usd_balance:,.2f}')